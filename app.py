@@ -1,13 +1,17 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from config import Config
+from json_provider import json_provider_class
+from compression import init_compression
 from models import db
+from migrations import migrate_cli, upgrade
 from connectors.auth import auth as auth_blueprint
 from connectors.product import products as product_blueprint
 from connectors.transaction import transactions as transaction_blueprint
 from connectors.upload_file import upload_file as upload_blueprint
 from connectors.user import user as user_blueprint
 from connectors.cart import cart as cart_blueprint  
+from connectors.cart.cart_sweeper import init_cart_sweeper
 from connectors.agen import agen as agen_blueprint
 from connectors.promotion import promotion as promotion_blueprint
 from flask_jwt_extended import JWTManager, get_jwt_identity, jwt_required, unset_jwt_cookies
@@ -16,11 +20,18 @@ import os
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
+app.json = json_provider_class(app.config.get("JSON_PROVIDER"))(app)
+init_compression(app)
+init_cart_sweeper(app)
 db.init_app(app)
 jwt = JWTManager(app)
 
-with app.app_context():
-    db.create_all()
+app.cli.add_command(migrate_cli)
+
+# Apply pending schema migrations on startup; set AUTO_MIGRATE=0 to run `flask db upgrade` during deploys instead
+if app.config.get("AUTO_MIGRATE"):
+    with app.app_context():
+        upgrade(db.engine)
 
 # Register blueprint
 app.register_blueprint(auth_blueprint, url_prefix='/auth')
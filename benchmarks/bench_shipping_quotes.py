@@ -0,0 +1,77 @@
+"""
+Shipping quote cost for a cart spanning several markets: one geopy geodesic
+per market (the calculation /delivery_location charges with) against one
+vectorized haversine pass over all markets (/shipping_quote estimates).
+
+    python benchmarks/bench_shipping_quotes.py [markets ...]
+
+Only the distance and tariff computation is timed; the old flow additionally
+made one HTTP request, two queries and a commit per market.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+from geopy.distance import geodesic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connectors.geo import np, parse_location  # noqa: E402
+from connectors.transaction.shipping import quote_shipping  # noqa: E402
+
+
+def legacy_quote(user_location, agent_location_json):
+    """The per-transaction geodesic calculation, as /delivery_location charges it, run for every market."""
+    agent_location = json.loads(agent_location_json)
+    distance_km = geodesic(user_location, (agent_location['lat'], agent_location['lng'])).kilometers
+    if distance_km <= 1:
+        cost_per_km = 8000
+    elif distance_km <= 2:
+        cost_per_km = 6000
+    elif distance_km <= 3:
+        cost_per_km = 5000
+    else:
+        cost_per_km = 4000
+    shipping_cost = round(distance_km * cost_per_km, 0)
+    if shipping_cost < 5000:
+        shipping_cost = 5000
+    return distance_km, shipping_cost
+
+
+def best_of(function, repeat=7):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    market_counts = [int(value) for value in sys.argv[1:]] or [1, 3, 10, 100, 1000]
+    random.seed(1)
+    user_location = (-7.7956, 110.3695)
+    print(f"numpy: {'installed' if np is not None else 'not installed, pure Python fallback'}; best of 7")
+    print(f"{'markets':>8} {'geopy':>12} {'vectorized':>12} {'speedup':>8} {'max dist diff':>14} {'max cost diff':>14}")
+
+    for count in market_counts:
+        locations = [
+            json.dumps({"lat": user_location[0] + random.uniform(-0.1, 0.1),
+                        "lng": user_location[1] + random.uniform(-0.1, 0.1)})
+            for _ in range(count)
+        ]
+
+        before, legacy = best_of(lambda: [legacy_quote(user_location, location) for location in locations])
+        after, quotes = best_of(lambda: quote_shipping(user_location, [parse_location(location) for location in locations]))
+
+        distance_diff = max(abs(new[0] - old[0]) / old[0] for old, new in zip(legacy, quotes))
+        cost_diff = max(abs(new[1] - old[1]) for old, new in zip(legacy, quotes))
+        print(f"{count:>8} {before * 1000:>9.3f} ms {after * 1000:>9.3f} ms {before / after:>7.1f}x"
+              f" {distance_diff:>13.3%} {cost_diff:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
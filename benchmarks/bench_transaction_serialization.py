@@ -0,0 +1,140 @@
+"""
+Serialization cost of transaction listings, before and after batching and the orjson provider.
+Building the dicts (queries included) and encoding them are timed apart, so the gain of
+batching and the gain of the provider are reported separately.
+
+    python benchmarks/bench_transaction_serialization.py [transactions] [items_per_transaction]
+
+Runs against an in-memory SQLite database, so query times are a lower bound
+of what MySQL would show over the network.
+"""
+import os
+import sys
+import time
+
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-benchmark-secret")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from json_provider import JSONProvider, OrjsonProvider, orjson  # noqa: E402
+from models import db  # noqa: E402
+from models.users import User  # noqa: E402
+from models.products import Product, Category  # noqa: E402
+from models.transactions import Transaction, TransactionItems  # noqa: E402
+
+
+def legacy_to_dict(transaction):
+    """Transaction.to_dict() as it was before batching: one market query and one product query per item."""
+    market = User.query.filter_by(id=transaction.to_user_id, role="agen").first()
+    market_name = market.fullname if market else "Unknown Market"
+    items = []
+    for item in transaction.transaction_items:
+        product = Product.query.get(item.product_id)
+        if product:
+            items.append({
+                "id": item.id,
+                "product_id": item.product_id,
+                "product_name": product.product_name,
+                "product_description": product.description,
+                "product_price": product.price,
+                "product_image_url": product.image_url,
+                "quantity": item.quantity,
+                "subtotal": item.subtotal,
+            })
+    return {
+        "id": transaction.id,
+        "from_user_id": transaction.from_user_id,
+        "to_user_id": transaction.to_user_id,
+        "market_name": market_name,
+        "total_amount": transaction.total_amount,
+        "driver_id": transaction.driver_id,
+        "type": transaction.type,
+        "shipping_cost": transaction.shipping_cost,
+        "status": transaction.status,
+        "description": transaction.description,
+        "user_location": transaction.user_location,
+        "driver_location": transaction.driver_location,
+        "created_at": transaction.created_at.isoformat() if transaction.created_at else None,
+        "updated_at": transaction.updated_at.isoformat() if transaction.updated_at else None,
+        "items": items,
+    }
+
+
+def seed(transaction_count, items_per_transaction):
+    db.drop_all()
+    db.create_all()
+    consumer = User(username="bench", fullname="Bench", email="bench@example.com", password_hash="x",
+                    pin_hash="x", phone_number="0", role="konsumen")
+    markets = [
+        User(username=f"market{i}", fullname=f"Market {i}", email=f"market{i}@example.com", password_hash="x",
+             pin_hash="x", phone_number=str(i + 1), role="agen")
+        for i in range(20)
+    ]
+    category = Category(category_name="Bench")
+    db.session.add_all([consumer, category, *markets])
+    db.session.flush()
+
+    products = [
+        Product(user_id=markets[i % len(markets)].id, category_id=category.id, product_name=f"Product {i}",
+                description="Benchmark product " * 10, price=1000 + i, stock=100)
+        for i in range(200)
+    ]
+    db.session.add_all(products)
+    db.session.flush()
+
+    for t in range(transaction_count):
+        transaction = Transaction(from_user_id=consumer.id, to_user_id=markets[t % len(markets)].id,
+                                  total_amount=0, status="ordered", type="transfer", shipping_cost=5000)
+        db.session.add(transaction)
+        db.session.flush()
+        for i in range(items_per_transaction):
+            product = products[(t * items_per_transaction + i) % len(products)]
+            db.session.add(TransactionItems(transaction_id=transaction.id, product_id=product.id,
+                                            quantity=1, subtotal=product.price))
+    db.session.commit()
+
+
+def measure(label, serialize, provider, repeat=5):
+    """Best (build, encode) times in seconds of `repeat` runs."""
+    best_build = best_encode = None
+    for _ in range(repeat):
+        db.session.expire_all()
+        transactions = Transaction.query.all()
+        start = time.perf_counter()
+        rows = serialize(transactions)
+        built = time.perf_counter()
+        body = provider.dumps(rows)
+        encoded = time.perf_counter()
+        best_build = built - start if best_build is None else min(best_build, built - start)
+        best_encode = encoded - built if best_encode is None else min(best_encode, encoded - built)
+    total = best_build + best_encode
+    print(f"{label:<40} {best_build * 1000:9.1f} {best_encode * 1000:9.1f} {total * 1000:9.1f} ms"
+          f"  {len(body) / 1024:6.0f} KiB")
+    return best_build, best_encode
+
+
+def main():
+    transaction_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    items_per_transaction = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with app.app_context():
+        seed(transaction_count, items_per_transaction)
+        print(f"{transaction_count} transactions x {items_per_transaction} items, best of 5")
+        print(f"{'':<40} {'build':>9} {'encode':>9} {'total':>9}")
+
+        before = measure("per-row to_dict + Flask json (before)",
+                         lambda rows: [legacy_to_dict(row) for row in rows], DefaultJSONProvider(app))
+        batched = measure("bulk_to_dict + stdlib json", Transaction.bulk_to_dict, JSONProvider(app))
+        print(f"batching: {sum(before) / sum(batched):.1f}x")
+        if orjson is None:
+            print("orjson is not installed; skipping the orjson provider")
+            return
+        after = measure("bulk_to_dict + orjson (after)", Transaction.bulk_to_dict, OrjsonProvider(app))
+        print(f"orjson provider: {batched[1] / after[1]:.1f}x on encoding, {sum(batched) / sum(after):.1f}x end to end")
+        print(f"overall: {sum(before) / sum(after):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Concurrent add-to-cart on one hot product: counts oversold units and measures throughput.
+
+    DATABASE_URL=mysql+pymysql://... python benchmarks/stress_stock_reservation.py [options]
+
+Each worker thread posts to /cart/add/<user_id> for the same product until all
+requests are sent. Afterwards the units in carts, the units taken from stock and
+the initial stock must agree. --legacy replays the old read-check-write
+reservation (`product.stock -= quantity` after a Python check) instead of the route,
+to show the race on the same database.
+
+Without DATABASE_URL a temporary SQLite file is used; SQLite serializes writers,
+so run against MySQL for throughput numbers representative of production.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/stress.db?timeout=30"
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-benchmark-secret")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from models.users import User  # noqa: E402
+from models.products import Product, Category  # noqa: E402
+from models.transactions import Transaction, TransactionItems  # noqa: E402
+
+
+def seed(workers, stock):
+    db.drop_all()
+    db.create_all()
+    if db.engine.dialect.name == "sqlite":
+        with db.engine.connect() as connection:
+            connection.execute(text("PRAGMA journal_mode=WAL"))
+
+    market = User(username="market", fullname="Market", email="market@example.com", password_hash="x",
+                  pin_hash="x", phone_number="0", role="agen")
+    consumers = [
+        User(username=f"buyer{i}", fullname=f"Buyer {i}", email=f"buyer{i}@example.com", password_hash="x",
+             pin_hash="x", phone_number=str(i + 1), role="konsumen")
+        for i in range(workers)
+    ]
+    category = Category(category_name="Flash sale")
+    db.session.add_all([market, category, *consumers])
+    db.session.flush()
+    product = Product(user_id=market.id, category_id=category.id, product_name="Hot item", price=1000, stock=stock)
+    db.session.add(product)
+    db.session.commit()
+    return product.id, [consumer.id for consumer in consumers]
+
+
+def legacy_reserve(product_id, quantity):
+    """The reservation as add_to_cart did it before: read, check in Python, write back."""
+    try:
+        product = Product.query.get(product_id)
+        if product.stock < quantity:
+            return 400
+        product.stock -= quantity
+        db.session.commit()
+        return 201
+    except Exception:
+        db.session.rollback()
+        return 500
+    finally:
+        db.session.remove()
+
+
+def run(args):
+    with app.app_context():
+        product_id, consumer_ids = seed(args.workers, args.stock)
+        dialect = db.engine.dialect.name
+
+    counts = {}
+    counts_lock = threading.Lock()
+    remaining = iter(range(args.requests))
+    remaining_lock = threading.Lock()
+
+    def worker(user_id):
+        client = app.test_client()
+        while True:
+            with remaining_lock:
+                if next(remaining, None) is None:
+                    return
+            if args.legacy:
+                with app.app_context():
+                    status = legacy_reserve(product_id, args.quantity)
+            else:
+                status = client.post(f"/cart/add/{user_id}",
+                                     json={"product_id": product_id, "quantity": args.quantity}).status_code
+            with counts_lock:
+                counts[status] = counts.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(user_id,)) for user_id in consumer_ids]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        final_stock = db.session.get(Product, product_id).stock
+        in_carts = db.session.query(db.func.coalesce(db.func.sum(TransactionItems.quantity), 0)) \
+            .join(Transaction).filter(TransactionItems.product_id == product_id, Transaction.status == "cart").scalar()
+
+    sold = counts.get(201, 0) * args.quantity
+    print(f"{'legacy read-check-write' if args.legacy else 'atomic conditional UPDATE (route)'} on {dialect}")
+    print(f"workers={args.workers} requests={args.requests} quantity={args.quantity} initial stock={args.stock}")
+    print(f"responses: {dict(sorted(counts.items()))}")
+    print(f"units granted={sold} taken from stock={args.stock - final_stock} final stock={final_stock}"
+          + ("" if args.legacy else f" in carts={in_carts}"))
+    # Units granted beyond the initial stock, and grants whose stock deduction was lost to a concurrent write
+    print(f"oversold units: {max(0, sold - args.stock)}  lost stock updates: {sold - (args.stock - final_stock)}")
+    print(f"throughput: {args.requests / elapsed:.0f} requests/s ({elapsed:.2f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--quantity", type=int, default=1)
+    parser.add_argument("--legacy", action="store_true", help="replay the old read-check-write reservation")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
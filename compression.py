@@ -0,0 +1,67 @@
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # declared in pyproject.toml; gzip only when missing
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript")
+
+
+def choose_encoding(accept_encodings):
+    """Best encoding both sides support: br when brotli is installed, else gzip."""
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response, min_size, gzip_level=6, brotli_quality=5):
+    """
+    Compress a buffered response body when the client accepts it and it is at least
+    `min_size` bytes. Streamed responses are left as they are. A strong ETag gets
+    the encoding appended, since the compressed bytes are a different representation.
+    """
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    if encoding == "br":
+        data = brotli.compress(data, quality=brotli_quality)
+    else:
+        data = gzip.compress(data, compresslevel=gzip_level)
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def init_compression(app):
+    """Register response compression, configured by COMPRESS_MIN_SIZE, COMPRESS_GZIP_LEVEL and COMPRESS_BROTLI_QUALITY."""
+    @app.after_request
+    def compress(response):
+        return compress_response(
+            response,
+            app.config.get("COMPRESS_MIN_SIZE", 1024),
+            app.config.get("COMPRESS_GZIP_LEVEL", 6),
+            app.config.get("COMPRESS_BROTLI_QUALITY", 5),
+        )
@@ -15,5 +15,18 @@ class Config:
     JWT_ACCESS_COOKIE_PATH = "/"
     JWT_COOKIE_CSRF_PROTECT = False  
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=60)
+    CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", 1024))
+    CATALOG_CACHE_TTL_SECONDS = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", 300))
+    AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1").lower() in ("1", "true", "yes")
+    SHIPPING_QUOTE_CACHE_MAX_ENTRIES = int(os.getenv("SHIPPING_QUOTE_CACHE_MAX_ENTRIES", 10000))
+    SHIPPING_QUOTE_CACHE_TTL_SECONDS = int(os.getenv("SHIPPING_QUOTE_CACHE_TTL_SECONDS", 300))
+    SHIPPING_QUOTE_PRECISION = int(os.getenv("SHIPPING_QUOTE_PRECISION", 4))
+    CART_TTL_SECONDS = int(os.getenv("CART_TTL_SECONDS", 24 * 60 * 60))
+    CART_SWEEP_INTERVAL_SECONDS = int(os.getenv("CART_SWEEP_INTERVAL_SECONDS", 600))
+    CART_SWEEP_BATCH_SIZE = int(os.getenv("CART_SWEEP_BATCH_SIZE", 500))
+    JSON_PROVIDER = os.getenv("JSON_PROVIDER", "orjson")
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+    COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 5))
     UPLOAD_FOLDER = os.path.join(os.getcwd(), "upload/uploaded_files")
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
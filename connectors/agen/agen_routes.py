@@ -1,6 +1,7 @@
 from flask import request, jsonify
 from models import db
 from models.agens import Agen
+from models.pagination import fetch_page, InvalidCursor
 from . import agen
 
 @agen.route('/add_agen', methods=['POST'])
@@ -26,8 +27,12 @@ def create_agen():
 
 @agen.route('/all_agens', methods=['GET'])
 def get_agens():
-    agens= Agen.query.all()
-    return jsonify([
+    try:
+        agens, next_cursor = fetch_page(Agen.query, Agen, request.args)
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+
+    agens_data = [
         {
             "id": agen.id,
             "name": agen.name,
@@ -37,7 +42,12 @@ def get_agens():
             "updated_at": agen.updated_at
         }
         for agen in agens
-    ])
+    ]
+
+    # Paginated requests get an object so the cursor can travel with the page
+    if 'limit' in request.args or 'after' in request.args:
+        return jsonify({"agens": agens_data, "next_cursor": next_cursor})
+    return jsonify(agens_data)
 
 @agen.route('/edit_agen/<int:agen_id>', methods=['PUT'])
 def update_agen(agen_id):
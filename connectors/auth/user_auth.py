@@ -4,6 +4,9 @@ from models.users import db, User
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from flask_jwt_extended import create_access_token, unset_jwt_cookies, jwt_required, get_jwt_identity
+from connectors.product.catalog_cache import catalog_cache
+from connectors.user.nearby_index import nearby_markets
+from connectors.transaction.shipping import shipping_quote_cache, shipping_charge_cache
 
 @auth.route('/register', methods=['POST'])
 def register():
@@ -48,6 +51,7 @@ def register():
     
     db.session.add(user)
     db.session.commit()
+    nearby_markets.update(user)
 
     return jsonify({'message': 'User registered successfully'}), 201
     
@@ -140,6 +144,12 @@ def profile():
         user.location = location
 
         db.session.commit()
+        # Market name is part of the cached agent product listing
+        catalog_cache.bump(('agent', user.id))
+        nearby_markets.update(user)
+        # Cached shipping quotes and charges were measured from the old location
+        shipping_quote_cache.invalidate_agent(user.id)
+        shipping_charge_cache.invalidate_agent(user.id)
 
         return jsonify({'message': 'Profile updated successfully'}), 200
 
@@ -3,4 +3,5 @@ from flask import Blueprint
 
 cart = Blueprint("cart", __name__)
 
-from . import cart_routes
\ No newline at end of file
+from . import cart_routes
+from . import cart_sweeper
@@ -1,12 +1,9 @@
 from . import cart
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from sqlalchemy.exc import IntegrityError
-from models.transactions import Transaction, TransactionItems
-from models.products import Product
-from models.users import User
-from models import db
-from datetime import datetime
+from models.transactions import Transaction
 from flask_jwt_extended import get_jwt_identity, jwt_required
+from .cart_service import CartError, add_items, set_item_quantity, remove_product, checkout
 
 #test blueprint
 @cart.route('/', methods=['GET'])
@@ -17,7 +14,7 @@ def test_cart():
 @cart.route("/list/<int:user_id>", methods=["GET"])
 def get_cart(user_id):
     transactions = Transaction.query.filter_by(from_user_id=user_id, status="cart").all()
-    return jsonify({"cart": [transaction.to_dict() for transaction in transactions]}), 200
+    return jsonify({"cart": Transaction.bulk_to_dict(transactions)}), 200
 
 @cart.route("/update_quantity", methods=["PUT"]) 
 @jwt_required() 
@@ -34,72 +31,15 @@ def update_quantity():
         if quantity <= 0: 
             return jsonify({"error": "Quantity must be greater than 0."}), 400 
  
-        # Find the item in the database 
-        item = TransactionItems.query.get(item_id) 
-        if not item: 
-            return jsonify({"error": "Item not found."}), 404 
- 
-        # Find the associated product
-        product = Product.query.get(item.product_id)
-        if not product:
-            return jsonify({"error": "Product not found."}), 404 
- 
-        # Calculate stock adjustment 
-        # If new quantity is less than old quantity, return stock 
-        # If new quantity is greater than old quantity, reduce stock
-        stock_adjustment = item.quantity - quantity
- 
-        # Check if there's enough stock when increasing quantity
-        if stock_adjustment < 0 and abs(stock_adjustment) > product.stock:
-            return jsonify({
-                "error": "Insufficient stock.", 
-                "available_stock": product.stock
-            }), 400 
- 
-        # Update product stock 
-        product.stock += stock_adjustment 
- 
-        # Update quantity and subtotal of transaction item
-        item.quantity = quantity 
-        item.subtotal = item.quantity * item.product.price  # Recalculate subtotal 
-        db.session.commit()
-        
-        # Find the associated transaction 
-        transaction = Transaction.query.get(item.transaction_id)
-        if not transaction: 
-            return jsonify({"error": "Associated transaction not found."}), 404 
- 
-        # Recalculate total amount by summing all item subtotals in the transaction 
-        total_amount = db.session.query(db.func.sum(TransactionItems.subtotal)) \
-            .filter(TransactionItems.transaction_id == transaction.id) \
-            .scalar() or 0 
- 
-        # Update transaction total amount 
-        transaction.total_amount = total_amount 
-         
-        db.session.commit() 
+        # Item, cart total and stock change in one unit of work
+        result = set_item_quantity(item_id, quantity)
  
         # Return response with updated data 
-        return jsonify({ 
-            "message": "Quantity updated successfully.", 
-            "item": { 
-                "id": item.id, 
-                "product_id": item.product_id, 
-                "quantity": item.quantity, 
-                "subtotal": item.subtotal 
-            }, 
-            "transaction": { 
-                "id": transaction.id, 
-                "total_amount": transaction.total_amount 
-            },
-            "product": {
-                "id": product.id,
-                "stock": product.stock
-            }
-        }), 200 
+        return jsonify({"message": "Quantity updated successfully.", **result}), 200 
  
+    except CartError as e:
+        return jsonify(e.to_dict()), e.status
     except Exception as e: 
-        db.session.rollback() 
         return jsonify({"error": "An error occurred.", "details": str(e)}), 500
 
 
@@ -114,131 +54,122 @@ def add_to_cart(user_id):
         if not user_id or not product_id or not quantity:
             return jsonify({"error": "Missing required fields"}), 400
 
-        # Fetch the product
-        product = Product.query.get(product_id)
-        if not product or product.is_active == 0:
-            return jsonify({"error": "Product not found or inactive"}), 404
-
-        if product.stock < quantity:
-            return jsonify({"error": "Insufficient stock"}), 400
-
-        # Check if there's already a cart transaction for this market_id (product.user_id)
-        transaction = Transaction.query.filter_by(
-            from_user_id=user_id,
-            to_user_id=product.user_id,
-            status="cart"
-        ).first()
-
-        if not transaction:
-            # Create a new transaction if no cart exists
-            transaction = Transaction(
-                from_user_id=user_id,
-                to_user_id=product.user_id,
-                driver_id=None,  # Will be assigned later
-                total_amount=0.0,  # Will be updated
-                type="transfer",
-                status="cart",
-                created_at=datetime.utcnow()
-            )
-            db.session.add(transaction)
-            db.session.flush()  # Ensure transaction ID is available
-
-        # Check if the product is already in the cart
-        transaction_item = TransactionItems.query.filter_by(
-            transaction_id=transaction.id,
-            product_id=product_id
-        ).first()
-
-        if transaction_item:
-            # Update the quantity and subtotal
-            transaction_item.quantity += quantity
-            transaction_item.subtotal += product.price * quantity
-        else:
-            # Add new item to the cart
-            transaction_item = TransactionItems(
-                transaction_id=transaction.id,
-                product_id=product_id,
-                quantity=quantity,
-                subtotal=product.price * quantity,
-                created_at=datetime.utcnow()
-            )
-            db.session.add(transaction_item)
-
-        # Update transaction total amount
-        transaction.total_amount += product.price * quantity
-
-        # Deduct stock from the product
-        product.stock -= quantity
-
-        db.session.commit()
+        quantities, error = parse_cart_items([{"product_id": product_id, "quantity": quantity}])
+        if error:
+            return jsonify({"error": "product_id and quantity must be positive integers"}), 400
+
+        # Add to the cart for this product's market (product.user_id), reserving stock
+        [transaction] = add_items(user_id, quantities)
 
         return jsonify({
             "message": "Product added to cart successfully",
-            "transaction": {
-                "id": transaction.id,
-                "from_user_id": transaction.from_user_id,
-                "to_user_id": transaction.to_user_id,
-                "status": transaction.status,
-                "total_amount": transaction.total_amount,
-                "items": [
-                    {
-                        "product_id": item.product_id,
-                        "quantity": item.quantity,
-                        "subtotal": item.subtotal
-                    } for item in transaction.transaction_items
-                ]
-            }
+            "transaction": transaction
         }), 201
 
+    except CartError as e:
+        return jsonify(e.to_dict()), e.status
+
     except IntegrityError as e:
-        db.session.rollback()
         print("Integrity Error:", e)
         return jsonify({"error": "Database integrity error", "details": str(e)}), 500
 
     except Exception as e:
-        db.session.rollback()
         print("General Error:", e)
         return jsonify({"error": "An error occurred", "details": str(e)}), 500
 
-    
-@cart.route("/delete/<int:user_id>/<int:product_id>", methods=["DELETE"])
-def delete_from_cart(user_id, product_id):
+MAX_CART_ITEMS_PER_REQUEST = 100
+
+def positive_int(value):
+    """`value` as a positive int, also from a digit string; None for anything else, booleans included."""
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    return None
+
+def parse_cart_items(items):
+    """
+    Validate a list of {"product_id", "quantity"} and merge repeated products.
+    :return: ({product_id: quantity} in request order, error message or None)
+    """
+    if not isinstance(items, list) or not items:
+        return None, "items must be a non-empty list"
+    if len(items) > MAX_CART_ITEMS_PER_REQUEST:
+        return None, f"At most {MAX_CART_ITEMS_PER_REQUEST} items per request"
+    quantities = {}
+    for index, entry in enumerate(items):
+        product_id = positive_int(entry.get("product_id")) if isinstance(entry, dict) else None
+        quantity = positive_int(entry.get("quantity")) if isinstance(entry, dict) else None
+        if product_id is None or quantity is None:
+            return None, f"items[{index}] needs a positive integer product_id and quantity"
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities, None
+
+@cart.route("/add_items/<int:user_id>", methods=["POST"])
+def add_items_to_cart(user_id):
+    """
+    Add several products to the user's carts in one request, e.g. for reorders and bundles.
+    Body: {"items": [{"product_id": 1, "quantity": 2}, ...]}
+    Either every item is added or none is.
+    """
     try:
-        # Find the transaction containing the product for the given user
-        transaction_item = TransactionItems.query.join(Transaction).filter(
-            TransactionItems.product_id == product_id,
-            Transaction.from_user_id == user_id,
-            Transaction.status == "cart"
-        ).first()
+        data = request.get_json() or {}
+        quantities, error = parse_cart_items(data.get("items"))
+        if error:
+            return jsonify({"error": error}), 400
 
-        if not transaction_item:
-            return jsonify({"error": "Product not found in the cart"}), 404
+        transactions = add_items(user_id, quantities)
 
-        # Update the transaction's total amount
-        transaction = Transaction.query.get(transaction_item.transaction_id)
-        if transaction:
-            transaction.total_amount -= transaction_item.subtotal
+        return jsonify({
+            "message": "Products added to cart successfully",
+            "transactions": transactions
+        }), 201
 
-        # Restore the product's stock
-        product = Product.query.get(product_id)
-        if product:
-            product.stock += transaction_item.quantity
+    except CartError as e:
+        return jsonify(e.to_dict()), e.status
 
-        # Delete the transaction item
-        db.session.delete(transaction_item)
+    except IntegrityError as e:
+        current_app.logger.exception("Adding items to the cart failed")
+        return jsonify({"error": "Database integrity error", "details": str(e)}), 500
 
-        # If the transaction has no more items, delete it as well
-        remaining_items = TransactionItems.query.filter_by(transaction_id=transaction.id).count()
-        if remaining_items == 0:
-            db.session.delete(transaction)
+    except Exception as e:
+        current_app.logger.exception("Adding items to the cart failed")
+        return jsonify({"error": "An error occurred", "details": str(e)}), 500
 
-        db.session.commit()
+@cart.route("/delete/<int:user_id>/<int:product_id>", methods=["DELETE"])
+def delete_from_cart(user_id, product_id):
+    try:
+        # Delete the item, restore the product's stock and drop the cart if it is now empty
+        remove_product(user_id, product_id)
 
         return jsonify({"message": "Product removed from cart successfully"}), 200
 
+    except CartError as e:
+        return jsonify({"error": str(e)}), e.status
     except IntegrityError:
-        db.session.rollback()
         return jsonify({"error": "Database error"}), 500
     except Exception as e:
-        db.session.rollback()
         return jsonify({"error": str(e)}), 500
+
+@cart.route("/checkout", methods=["POST"])
+@jwt_required()
+def checkout_cart():
+    """
+    Pay for all of the current user's carts, across markets, in one request.
+    Body: {"pin_hash": "..."}
+    Either every cart is ordered and paid or none is.
+    """
+    try:
+        data = request.get_json() or {}
+        pin_hash = data.get("pin_hash")
+        if not pin_hash:
+            return jsonify({"error": "PIN is required."}), 400
+
+        result = checkout(int(get_jwt_identity()), pin_hash)
+
+        return jsonify({"message": "Checkout completed successfully", **result}), 200
+
+    except CartError as e:
+        return jsonify(e.to_dict()), e.status
+    except Exception as e:
+        return jsonify({"error": "An error occurred while processing the request.", "details": str(e)}), 500
@@ -0,0 +1,383 @@
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import delete, exists, select, update
+from werkzeug.security import check_password_hash
+from models import db
+from models.users import User
+from models.products import Product
+from models.transactions import Transaction, TransactionItems
+from connectors.product.catalog_cache import catalog_cache
+from connectors.promotion.promotion_index import active_promotions
+from .stock import reserve_stock, reserve_stock_many, release_stock
+
+
+class CartError(Exception):
+    """A cart change that cannot be applied. `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+    def to_dict(self):
+        return {"error": str(self), **self.details}
+
+
+def total_amount_update(transaction_ids):
+    """One UPDATE setting each transaction's total_amount to the sum of its item subtotals."""
+    subtotals = select(db.func.coalesce(db.func.sum(TransactionItems.subtotal), 0)) \
+        .where(TransactionItems.transaction_id == Transaction.id) \
+        .scalar_subquery()
+    return update(Transaction).where(Transaction.id.in_(transaction_ids)).values(total_amount=subtotals)
+
+
+def commit(stale_scopes):
+    """Commit the unit of work, then invalidate the catalog listings showing the changed stock."""
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    catalog_cache.bump(*stale_scopes)
+
+
+def product_scopes(products):
+    """Catalog cache scopes of products, read before the commit expires them."""
+    scopes = {('catalog',)}
+    for product in products:
+        scopes.update((('agent', product.user_id), ('category', product.category_id)))
+    return scopes
+
+
+def add_items(user_id, quantities):
+    """
+    Add products to the user's per-market carts, creating missing carts.
+    Products, carts and cart items are loaded in one query each, totals are recomputed in one
+    UPDATE, stock for every product is taken in one conditional UPDATE, and everything is
+    committed once: either every item is added or none is.
+    :param quantities: {product_id: quantity}
+    :return: Summaries of the changed carts, as {id, from_user_id, to_user_id, status, total_amount, items}.
+    :raises CartError: Unknown or inactive products (404) or insufficient stock (400).
+    """
+    products = {product.id: product for product in Product.query.filter(Product.id.in_(list(quantities))).all()}
+    unavailable = [
+        product_id for product_id in quantities
+        if product_id not in products or products[product_id].is_active == 0
+    ]
+    if unavailable:
+        raise CartError("Product not found or inactive", 404, product_ids=unavailable)
+
+    # Early rejection only; reserve_stock_many() below is the check that holds under concurrency
+    short = {product_id: products[product_id].stock for product_id, quantity in quantities.items()
+             if products[product_id].stock < quantity}
+    if short:
+        raise CartError("Insufficient stock", 400, available_stock=short)
+
+    try:
+        # Existing cart transaction per market (product.user_id), creating the missing ones
+        market_ids = {product.user_id for product in products.values()}
+        carts = {}
+        for transaction in Transaction.query.filter(
+            Transaction.from_user_id == user_id,
+            Transaction.to_user_id.in_(market_ids),
+            Transaction.status == "cart"
+        ).order_by(Transaction.id).with_for_update().all():
+            carts.setdefault(transaction.to_user_id, transaction)
+        for market_id in market_ids - set(carts):
+            carts[market_id] = Transaction(
+                from_user_id=user_id,
+                to_user_id=market_id,
+                driver_id=None,  # Will be assigned later
+                total_amount=0.0,  # Will be updated
+                type="transfer",
+                status="cart",
+                created_at=datetime.utcnow()
+            )
+            db.session.add(carts[market_id])
+        db.session.flush()  # Ensure transaction IDs are available
+
+        # Every item of those carts: finds the products already in them and lists the carts in the response
+        summaries = {
+            transaction.id: {
+                "id": transaction.id,
+                "from_user_id": transaction.from_user_id,
+                "to_user_id": transaction.to_user_id,
+                "status": transaction.status,
+                "items": [],
+            } for transaction in sorted(carts.values(), key=lambda transaction: transaction.id)
+        }
+        existing_items = {}
+        for item in TransactionItems.query.filter(TransactionItems.transaction_id.in_(list(summaries))) \
+                .order_by(TransactionItems.id).all():
+            line = {"product_id": item.product_id, "quantity": item.quantity, "subtotal": item.subtotal}
+            summaries[item.transaction_id]["items"].append(line)
+            existing_items.setdefault((item.transaction_id, item.product_id), (item, line))
+
+        for product_id, quantity in quantities.items():
+            product = products[product_id]
+            transaction_id = carts[product.user_id].id
+            subtotal = product.price * quantity
+            if (transaction_id, product_id) in existing_items:
+                # Update the quantity and subtotal, relative to the stored values
+                item, line = existing_items[(transaction_id, product_id)]
+                item.quantity = TransactionItems.quantity + quantity
+                item.subtotal = TransactionItems.subtotal + subtotal
+                line["quantity"] += quantity
+                line["subtotal"] += subtotal
+            else:
+                db.session.add(TransactionItems(
+                    transaction_id=transaction_id,
+                    product_id=product_id,
+                    quantity=quantity,
+                    subtotal=subtotal,
+                    created_at=datetime.utcnow()
+                ))
+                summaries[transaction_id]["items"].append(
+                    {"product_id": product_id, "quantity": quantity, "subtotal": subtotal}
+                )
+        db.session.flush()
+        db.session.execute(total_amount_update(list(summaries)), execution_options={"synchronize_session": False})
+
+        # Deduct stock for every product last: the product rows stay locked until the commit right after
+        if not reserve_stock_many(quantities):
+            db.session.rollback()
+            stocks = dict(db.session.query(Product.id, Product.stock).filter(Product.id.in_(list(quantities))).all())
+            raise CartError("Insufficient stock", 400, available_stock={
+                product_id: stocks.get(product_id) for product_id, quantity in quantities.items()
+                if (stocks.get(product_id) or 0) < quantity
+            })
+
+        stale_scopes = product_scopes(products.values())
+    except Exception:
+        db.session.rollback()
+        raise
+    commit(stale_scopes)
+
+    for summary in summaries.values():
+        summary["total_amount"] = sum(line["subtotal"] for line in summary["items"])
+    return list(summaries.values())
+
+
+def set_item_quantity(item_id, quantity):
+    """
+    Change a cart item's quantity, reserving or returning the stock difference.
+    The item's cart is locked and its items come from one query; the item, the cart total and
+    the stock each take one UPDATE, and the change is committed once.
+    :return: {"item": {...}, "transaction": {"id", "total_amount"}, "product": {"id", "stock"}}
+    :raises CartError: Unknown item, item not in a cart, or unknown product (404), concurrent
+        change of the item (409) or insufficient stock (400).
+    """
+    # Lock the item's cart first, so a concurrent checkout either waits for this change
+    # or has already ordered the cart, which then no longer matches
+    transaction_id = select(TransactionItems.transaction_id).where(TransactionItems.id == item_id).scalar_subquery()
+    locked = db.session.query(Transaction.id).filter(Transaction.id == transaction_id, Transaction.status == "cart") \
+        .with_for_update().first()
+    items = TransactionItems.query.filter(TransactionItems.transaction_id == locked.id).all() if locked else []
+    item = next((item for item in items if item.id == item_id), None)
+    if not item:
+        db.session.rollback()
+        raise CartError("Item not found.", 404)
+
+    product = db.session.get(Product, item.product_id)
+    if not product:
+        db.session.rollback()
+        raise CartError("Product not found.", 404)
+
+    # Positive: reserve the difference; negative: return the difference to stock
+    stock_adjustment = quantity - item.quantity
+    subtotal = quantity * product.price
+    total_amount = sum(subtotal if other.id == item.id else other.subtotal for other in items)
+    summary = {
+        "item": {"id": item.id, "product_id": item.product_id, "quantity": quantity, "subtotal": subtotal},
+        "transaction": {"id": item.transaction_id, "total_amount": total_amount},
+        "product": {"id": product.id, "stock": product.stock - stock_adjustment},
+    }
+    stale_scopes = product_scopes([product])
+
+    try:
+        # Apply only if no concurrent request changed the item since it was read,
+        # so two updates of the same item cannot both apply their stock adjustment
+        updated = TransactionItems.query.filter(
+            TransactionItems.id == item.id,
+            TransactionItems.quantity == item.quantity
+        ).update({TransactionItems.quantity: quantity, TransactionItems.subtotal: subtotal}, synchronize_session=False)
+        if not updated:
+            raise CartError("The item was changed by another request, please retry.", 409)
+        db.session.execute(total_amount_update([item.transaction_id]), execution_options={"synchronize_session": False})
+
+        # Adjust stock last: the product row stays locked until the commit right after
+        if stock_adjustment > 0 and not reserve_stock(product.id, stock_adjustment):
+            available = db.session.query(Product.stock).filter(Product.id == product.id).scalar()
+            raise CartError("Insufficient stock.", 400, available_stock=available)
+        if stock_adjustment < 0:
+            release_stock(product.id, -stock_adjustment)
+    except Exception:
+        db.session.rollback()
+        raise
+    commit(stale_scopes)
+    return summary
+
+
+def remove_product(user_id, product_id):
+    """
+    Remove a product from the user's cart and return its quantity to stock.
+    A cart left without items is deleted by a conditional DELETE; otherwise its total is
+    recomputed in one UPDATE. Committed once.
+    :raises CartError: The product is not in the user's cart (404).
+    """
+    found = db.session.query(
+        TransactionItems.id, TransactionItems.transaction_id, TransactionItems.quantity,
+        Product.user_id, Product.category_id
+    ).join(Transaction, Transaction.id == TransactionItems.transaction_id) \
+        .join(Product, Product.id == TransactionItems.product_id) \
+        .filter(
+            TransactionItems.product_id == product_id,
+            Transaction.from_user_id == user_id,
+            Transaction.status == "cart"
+        ).with_for_update(of=Transaction).first()
+    if not found:
+        db.session.rollback()
+        raise CartError("Product not found in the cart", 404)
+    item_id, transaction_id, quantity, _, _ = found
+
+    try:
+        db.session.execute(delete(TransactionItems).where(TransactionItems.id == item_id),
+                           execution_options={"synchronize_session": False})
+        release_stock(product_id, quantity)
+
+        # Delete the cart if that was its last item, else recompute its total
+        emptied = db.session.execute(
+            delete(Transaction).where(
+                Transaction.id == transaction_id,
+                Transaction.status == "cart",
+                ~exists().where(TransactionItems.transaction_id == transaction_id)
+            ),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        if not emptied:
+            db.session.execute(total_amount_update([transaction_id]), execution_options={"synchronize_session": False})
+    except Exception:
+        db.session.rollback()
+        raise
+    commit(product_scopes([found]))
+
+
+def checkout(user_id, pin):
+    """
+    Pay for every cart transaction of the user at once and mark them "ordered".
+    The PIN is checked once, the carts are locked and their items and current promotions are
+    loaded in one query each. Discounts lower the item subtotals, cashback is credited, and
+    the combined totals plus shipping are debited from the balance in one conditional UPDATE.
+    Committed once: either every cart is paid or none is.
+    Cart changes lock their cart row too, so none can slip in between reading the items
+    and ordering the cart.
+    :return: {"transactions": [{id, to_user_id, status, total_amount, shipping_cost}],
+        "total_amount", "shipping_cost", "cashback", "balance"}
+    :raises CartError: Unknown user or no cart (404), invalid PIN (401), a cart without
+        delivery location or with a non-positive total or line (400), a cart ordered by a
+        concurrent checkout (409) or insufficient balance (403).
+    """
+    user = db.session.get(User, user_id)
+    if not user:
+        raise CartError("User not found.", 404)
+    if not user.pin_hash or not check_password_hash(user.pin_hash, pin):
+        raise CartError("Invalid PIN.", 401)
+
+    # Lock the carts and read their items with a locking read, which sees the latest committed
+    # rows: cart changes lock the cart first, so they either finished before this or wait for it
+    carts = Transaction.query.filter(Transaction.from_user_id == user_id, Transaction.status == "cart") \
+        .order_by(Transaction.id).with_for_update().all()
+    if not carts:
+        db.session.rollback()
+        raise CartError("No cart to check out.", 404)
+    cart_ids = [transaction.id for transaction in carts]
+
+    # Shipping is charged from the location set by /transaction/delivery_location
+    undelivered = [transaction.id for transaction in carts
+                   if transaction.shipping_cost is None or not transaction.user_location]
+    if undelivered:
+        db.session.rollback()
+        raise CartError("Set the delivery location of every cart before checkout.", 400,
+                        transaction_ids=undelivered)
+
+    items = TransactionItems.query.filter(TransactionItems.transaction_id.in_(cart_ids)).with_for_update().all()
+    promotions = active_promotions({item.product_id for item in items})
+
+    # Same promotion rules as /transaction/update_balance_and_status, for all carts in one pass
+    totals = {transaction_id: Decimal(0) for transaction_id in cart_ids}
+    discounted = {}
+    cashback = Decimal(0)
+    for item in items:
+        subtotal = Decimal(str(item.subtotal))
+        promotion = promotions.get(item.product_id)
+        if promotion and promotion.scheme == 'discount':
+            subtotal -= (Decimal(promotion.scheme_percentage) / 100) * subtotal
+            discounted[item.id] = subtotal
+        elif promotion and promotion.scheme == 'cashback':
+            cashback += (Decimal(promotion.scheme_percentage) / 100) * subtotal
+        totals[item.transaction_id] += subtotal
+
+    # A non-positive line would lower what the other lines and carts are charged
+    invalid = sorted({item.transaction_id for item in items if item.quantity <= 0 or item.subtotal <= 0}
+                     | {transaction_id for transaction_id, total in totals.items() if total <= 0})
+    if invalid:
+        db.session.rollback()
+        raise CartError("Cart total must be positive.", 400, transaction_ids=invalid)
+
+    total_amount = sum(totals.values())
+    shipping_cost = sum(Decimal(str(transaction.shipping_cost)) for transaction in carts)
+    amount_due = total_amount + shipping_cost
+
+    try:
+        # Only carts still in "cart" are ordered, so a concurrent checkout cannot pay them twice
+        ordered = db.session.execute(
+            update(Transaction)
+            .where(Transaction.id.in_(cart_ids), Transaction.status == "cart")
+            .values(
+                status="ordered",
+                total_amount=db.case({transaction_id: float(total) for transaction_id, total in totals.items()},
+                                     value=Transaction.id),
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if ordered != len(cart_ids):
+            raise CartError("A cart was ordered by another request, please retry.", 409)
+
+        if discounted:
+            db.session.execute(
+                update(TransactionItems)
+                .where(TransactionItems.id.in_(list(discounted)))
+                .values(subtotal=db.case({item_id: float(subtotal) for item_id, subtotal in discounted.items()},
+                                         value=TransactionItems.id))
+                .execution_options(synchronize_session=False)
+            )
+
+        # Credit the cashback and debit everything due in one UPDATE; the balance check
+        # happens in the WHERE clause so concurrent payments cannot overdraw it
+        debited = db.session.execute(
+            update(User)
+            .where(User.id == user_id, User.balance + cashback >= amount_due)
+            .values(balance=User.balance + cashback - amount_due)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not debited:
+            raise CartError("Insufficient balance", 403, amount_due=float(amount_due), cashback=float(cashback))
+
+        summary = {
+            "transactions": [{
+                "id": transaction.id,
+                "to_user_id": transaction.to_user_id,
+                "status": "ordered",
+                "total_amount": float(totals[transaction.id]),
+                "shipping_cost": transaction.shipping_cost,
+            } for transaction in carts],
+            "total_amount": float(total_amount),
+            "shipping_cost": float(shipping_cost),
+            "cashback": float(cashback),
+            "balance": float(db.session.query(User.balance).filter(User.id == user_id).scalar()),
+        }
+    except Exception:
+        db.session.rollback()
+        raise
+    commit(())
+    return summary
@@ -0,0 +1,130 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from models import db
+from models.products import Product, Promotion
+from models.transactions import Transaction, TransactionItems, Delivery
+from connectors.product.catalog_cache import catalog_cache
+from . import cart
+
+DEFAULT_CART_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_SWEEP_BATCH_SIZE = 500
+
+
+def sweep_expired_carts(ttl_seconds=DEFAULT_CART_TTL_SECONDS, batch_size=DEFAULT_SWEEP_BATCH_SIZE):
+    """
+    Delete cart transactions untouched for `ttl_seconds` and give their items' quantities back to stock.
+    Carts a promotion refers to are kept.
+    Works in batches, one database transaction each: the expired carts are locked, the
+    quantities per product go back in one UPDATE, and items and carts are deleted in bulk.
+    Locked rows are skipped where the database supports it, so several sweepers can run at once.
+    Needs an app context.
+    :return: {"carts": deleted carts, "items": deleted items, "products": restocked products, "units": restored units}
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+    totals = {"carts": 0, "items": 0, "products": 0, "units": 0}
+
+    while True:
+        try:
+            cart_ids = [row.id for row in db.session.query(Transaction.id).filter(
+                Transaction.status == "cart",
+                db.func.coalesce(Transaction.updated_at, Transaction.created_at) < cutoff,
+                # A promotion may point at a cart; deleting that cart would fail the whole batch
+                # on the foreign key, again on every run, so such carts are left alone
+                ~db.exists().where(Promotion.transaction_id == Transaction.id),
+            ).order_by(Transaction.id).limit(batch_size).with_for_update(skip_locked=True).all()]
+            if not cart_ids:
+                db.session.rollback()
+                return totals
+
+            quantities = dict(db.session.query(
+                TransactionItems.product_id, db.func.sum(TransactionItems.quantity)
+            ).filter(TransactionItems.transaction_id.in_(cart_ids)).group_by(TransactionItems.product_id).all())
+
+            if quantities:
+                Product.query.filter(Product.id.in_(list(quantities))).update({
+                    Product.stock: Product.stock + db.case(quantities, value=Product.id, else_=0),
+                }, synchronize_session=False)
+            items = TransactionItems.query.filter(TransactionItems.transaction_id.in_(cart_ids)) \
+                .delete(synchronize_session=False)
+            Delivery.query.filter(Delivery.transaction_id.in_(cart_ids)).delete(synchronize_session=False)
+            carts = Transaction.query.filter(Transaction.id.in_(cart_ids), Transaction.status == "cart") \
+                .delete(synchronize_session=False)
+
+            restocked = Product.query.with_entities(Product.id, Product.user_id, Product.category_id) \
+                .filter(Product.id.in_(list(quantities))).all() if quantities else []
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # Stock is part of the cached catalog listings
+        for product in restocked:
+            catalog_cache.bump_product(product)
+
+        totals["carts"] += carts
+        totals["items"] += items
+        totals["products"] += len(quantities)
+        totals["units"] += sum(quantities.values())
+        if len(cart_ids) < batch_size:
+            return totals
+
+
+def init_cart_sweeper(app):
+    """
+    Sweep expired carts in a background thread every CART_SWEEP_INTERVAL_SECONDS (0 disables it).
+    The thread starts with the first request, so CLI commands and scripts importing the app do not run it.
+    """
+    interval = app.config.get("CART_SWEEP_INTERVAL_SECONDS", 0)
+    if not interval:
+        return
+    start_lock = threading.Lock()
+    started = []
+
+    def sweep_forever():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    totals = sweep_expired_carts(
+                        app.config.get("CART_TTL_SECONDS", DEFAULT_CART_TTL_SECONDS),
+                        app.config.get("CART_SWEEP_BATCH_SIZE", DEFAULT_SWEEP_BATCH_SIZE),
+                    )
+                    if totals["carts"]:
+                        app.logger.info(
+                            "Cart sweep reclaimed %(carts)d carts, %(items)d items and "
+                            "restored %(units)d units to %(products)d products", totals
+                        )
+                except Exception:
+                    app.logger.exception("Cart sweep failed")
+                finally:
+                    db.session.remove()
+
+    @app.before_request
+    def start_cart_sweeper():
+        if started:
+            return
+        with start_lock:
+            if not started:
+                threading.Thread(target=sweep_forever, name="cart-sweeper", daemon=True).start()
+                started.append(True)
+
+
+# flask cart sweep
+@cart.cli.command('sweep')
+@click.option('--ttl-seconds', type=int, default=None, help='Age of an expired cart; defaults to CART_TTL_SECONDS.')
+def sweep_command(ttl_seconds):
+    """Delete expired carts now and return their reserved stock."""
+    try:
+        totals = sweep_expired_carts(
+            ttl_seconds if ttl_seconds is not None else current_app.config.get("CART_TTL_SECONDS", DEFAULT_CART_TTL_SECONDS),
+            current_app.config.get("CART_SWEEP_BATCH_SIZE", DEFAULT_SWEEP_BATCH_SIZE),
+        )
+        click.echo(
+            f"Reclaimed {totals['carts']} carts and {totals['items']} items; "
+            f"restored {totals['units']} units to {totals['products']} products."
+        )
+    except Exception as e:
+        raise click.ClickException(f"An error occurred: {str(e)}")
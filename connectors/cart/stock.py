@@ -0,0 +1,55 @@
+from sqlalchemy import update
+from models import db
+from models.products import Product
+
+
+def reserve_stock(product_id, quantity):
+    """
+    Take `quantity` units of a product's stock in one conditional UPDATE.
+    The stock check happens in the WHERE clause, inside the database, so concurrent
+    reservations can never take more than is there, without locking in Python.
+    The product row stays locked until the caller commits, so call this last.
+    :return: True when reserved, False when the product does not have enough stock.
+    """
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.stock >= quantity)
+        .values(stock=Product.stock - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def release_stock(product_id, quantity):
+    """Give `quantity` units back to a product's stock, relative to its current value."""
+    db.session.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(stock=Product.stock + quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def available_stock(product_id):
+    return db.session.query(Product.stock).filter(Product.id == product_id).scalar()
+
+
+def reserve_stock_many(quantities):
+    """
+    Take stock for several products in one conditional UPDATE.
+    Products short of stock are left out by the WHERE clause, so the row count tells
+    whether every product was reserved.
+    :param quantities: {product_id: quantity}
+    :return: True when all were reserved. False when any was short; the caller must then
+        roll back, since the products that had enough stock were reserved.
+    """
+    if not quantities:
+        return True
+    requested = db.case(quantities, value=Product.id, else_=0)
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(list(quantities)), Product.stock >= requested)
+        .values(stock=Product.stock - requested)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(quantities)
@@ -0,0 +1,52 @@
+import json
+import math
+
+try:
+    import numpy as np
+except ImportError:  # declared in pyproject.toml; distances are computed one by one when missing
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+
+def parse_location(value):
+    """
+    (lat, lng) from a location as stored on users and transactions,
+    a JSON string like '{"lat": -7.824557, "lng": 110.373333}'.
+    :return: Tuple of floats, or None when the value is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        location = json.loads(value) if isinstance(value, str) else value
+        lat, lng = float(location['lat']), float(location['lng'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km on a spherical earth; within 0.5% of the geodesic distance."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_many(lat, lng, lats, lngs):
+    """
+    Distances in km from one point to many, in one vectorized NumPy pass.
+    :return: NumPy array, or a list when NumPy is not installed.
+    """
+    if np is None:
+        return [haversine_km(lat, lng, other_lat, other_lng) for other_lat, other_lng in zip(lats, lngs)]
+
+    phi1 = np.radians(lat)
+    phi2 = np.radians(np.asarray(lats, dtype=np.float64))
+    d_lambda = np.radians(np.asarray(lngs, dtype=np.float64) - lng)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
@@ -3,3 +3,5 @@ from flask import Blueprint
 products = Blueprint("products", __name__)
 
 from . import product_routes  
+from . import product_commands
+from . import product_import
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, Response
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 300
+
+
+class CatalogCache:
+    """
+    LRU cache of serialized catalog responses.
+    Every entry records the scopes it was built from, e.g. ('agent', 3) or
+    ('category', 7), with their versions. Write routes bump those versions,
+    which makes exactly the dependent entries stale; a scope that names a value,
+    such as the current promotion window, goes stale when the value changes. Versions are per process, so
+    entries also expire after a TTL to bound staleness across workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (versions, created_at, body, mimetype)
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def versions(self, scopes):
+        with self._lock:
+            return tuple((scope, self._versions.get(scope, 0)) for scope in scopes)
+
+    def bump(self, *scopes):
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def bump_product(self, product, old_category_id=None):
+        """Invalidate every listing a product appears in."""
+        scopes = [('catalog',), ('agent', product.user_id), ('category', product.category_id)]
+        if old_category_id is not None and old_category_id != product.category_id:
+            scopes.append(('category', old_category_id))
+        self.bump(*scopes)
+
+    def get(self, key, scopes):
+        ttl = current_app.config.get('CATALOG_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS)
+        with self._lock:
+            entry = self._entries.get(key)
+            current = tuple((scope, self._versions.get(scope, 0)) for scope in scopes)
+            if entry is None or entry[0] != current or time.monotonic() - entry[1] > ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, versions, body, mimetype):
+        max_entries = current_app.config.get('CATALOG_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+        with self._lock:
+            self._entries[key] = (versions, time.monotonic(), body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, scopes_for):
+        """
+        Cache a GET view's 200 responses, keyed by path and query parameters.
+        :param scopes_for: Function of the view kwargs returning the scopes the response depends on.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                scopes = scopes_for(**kwargs)
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                entry = self.get(key, scopes)
+                if entry is not None:
+                    return Response(entry[2], status=200, mimetype=entry[3])
+
+                # Snapshot versions before building, so a concurrent write leaves this entry stale
+                versions = self.versions(scopes)
+                response = current_app.make_response(view(*args, **kwargs))
+                # Streamed responses are not buffered, so there is nothing to keep
+                if response.status_code == 200 and not response.is_streamed:
+                    self.set(key, versions, response.get_data(), response.mimetype)
+                return response
+            return wrapper
+        return decorator
+
+
+catalog_cache = CatalogCache()
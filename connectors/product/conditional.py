@@ -0,0 +1,121 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, request
+from models import db
+from models.products import Product, ProductReview, Promotion, Category
+from models.users import User
+
+
+def conditional(validator_for):
+    """
+    Answer conditional GETs before the view does any serialization work.
+    :param validator_for: Function of the view kwargs returning (state, last_modified)
+        from cheap aggregate queries, or None to skip conditional handling.
+        `state` is any repr-able value that changes whenever the response would.
+    The strong ETag hashes `state` with the full request path, so every page and
+    filter gets its own tag. `state` comes from the database alone, so every worker
+    process gives the same representation the same tag, across restarts too; the
+    timestamps have microseconds, so edits within one second still change it.
+    Deletions only change the ETag, not Last-Modified.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            validator = validator_for(**kwargs)
+            if validator is None:
+                return view(*args, **kwargs)
+
+            state, last_modified = validator
+            etag = hashlib.sha1(repr((request.full_path, state)).encode()).hexdigest()
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+
+            matched_etag = not_modified_etag(etag, last_modified)
+            if matched_etag:
+                response = current_app.response_class(status=304)
+                response.set_etag(matched_etag)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
+
+
+def not_modified_etag(etag, last_modified):
+    """
+    The ETag to answer 304 with when the client's copy is current, else None.
+    Compressed responses carry the encoding as a suffix, so those tags match too.
+    """
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        for candidate in (etag, f"{etag}-gzip", f"{etag}-br"):
+            if request.if_none_match.contains(candidate):
+                return candidate
+        return None
+    if request.if_modified_since and last_modified is not None and last_modified <= request.if_modified_since:
+        return etag
+    return None
+
+
+def latest(*timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def table_state(model, *criteria):
+    """(count, max id, latest created/updated timestamp) of a table in one query."""
+    return db.session.query(
+        db.func.count(model.id),
+        db.func.max(model.id),
+        db.func.max(db.func.coalesce(model.updated_at, model.created_at)),
+    ).filter(*criteria).one()
+
+
+def promotions_state(*criteria):
+    """
+    table_state() of promotions plus the next time one of them starts or ends, in one query,
+    so the state also changes when a promotion becomes active or expires.
+    """
+    now = datetime.utcnow()
+    return db.session.query(
+        db.func.count(Promotion.id),
+        db.func.max(Promotion.id),
+        db.func.max(db.func.coalesce(Promotion.updated_at, Promotion.created_at)),
+        db.func.min(db.case((Promotion.start_date > now, Promotion.start_date))),
+        db.func.min(db.case((Promotion.end_date > now, Promotion.end_date))),
+    ).filter(*criteria).one()
+
+
+def catalog_validator():
+    products_state = table_state(Product)
+    promotions = promotions_state(Promotion.product_id.isnot(None))
+    state = (products_state, promotions)
+    return state, latest(products_state[2], promotions[2])
+
+
+def categories_validator():
+    # Categories are only ever added, so count and highest id identify the set
+    return db.session.query(db.func.count(Category.id), db.func.max(Category.id)).one(), None
+
+
+def product_validator(product_id):
+    product = db.session.get(Product, product_id)
+    if not product:
+        return None
+    reviews_state = table_state(ProductReview, ProductReview.product_id == product_id)
+    promotions = promotions_state(Promotion.product_id == product_id)
+    product_modified = product.updated_at or product.created_at
+    # Shop name is part of the detail response
+    shop_modified = db.session.query(User.updated_at).filter(User.id == product.user_id).scalar()
+    state = (
+        product_modified, product.category_id, product.user_id, shop_modified,
+        reviews_state, promotions,
+    )
+    return state, latest(product_modified, reviews_state[2], promotions[2])
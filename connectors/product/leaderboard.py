@@ -0,0 +1,131 @@
+import heapq
+import threading
+import time
+from models.products import Product
+
+TOP_K = 50
+
+
+class BestSellers:
+    """
+    In-memory best seller rankings driven by Product.ordered_times.
+    Sales counters only grow, so each ranking (overall, per category, per agent)
+    is kept as a sorted top-K list updated in place on every sale. Removals and
+    category/activity changes mark the affected rankings for recomputation from
+    the counters. Reloaded after `refresh_seconds` to include other workers' sales.
+    """
+
+    def __init__(self, k=TOP_K, refresh_seconds=60):
+        self.k = k
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._products = {}  # product_id -> [ordered_times, category_id, user_id, is_active]
+        self._rankings = {}  # scope -> [(ordered_times, product_id)] best first
+
+    def _scopes(self, product_id):
+        _, category_id, user_id, _ = self._products[product_id]
+        return (('all',), ('category', category_id), ('agent', user_id))
+
+    def _load(self):
+        """Reload counters from the products table. Needs an app context."""
+        rows = Product.query.with_entities(
+            Product.id, Product.ordered_times, Product.category_id, Product.user_id, Product.is_active
+        ).filter(Product.ordered_times > 0).all()
+
+        with self._lock:
+            self._products = {
+                product_id: [ordered_times, category_id, user_id, is_active]
+                for product_id, ordered_times, category_id, user_id, is_active in rows
+            }
+            self._rankings = {}
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            self._load()
+
+    def _compute(self, scope):
+        candidates = (
+            (ordered_times, product_id)
+            for product_id, (ordered_times, category_id, user_id, is_active) in self._products.items()
+            if is_active and (
+                scope[0] == 'all'
+                or (scope[0] == 'category' and category_id == scope[1])
+                or (scope[0] == 'agent' and user_id == scope[1])
+            )
+        )
+        return heapq.nlargest(self.k, candidates, key=lambda entry: (entry[0], -entry[1]))
+
+    def _sort_key(self, entry):
+        return (-entry[0], entry[1])
+
+    def record_sales(self, product_quantities, product_details):
+        """
+        Count completed sales.
+        :param product_quantities: {product_id: quantity sold}
+        :param product_details: {product_id: (category_id, user_id, is_active)} for products not yet tracked
+        """
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for product_id, quantity in product_quantities.items():
+                entry = self._products.get(product_id)
+                if entry is None:
+                    if product_id not in product_details:
+                        continue
+                    entry = self._products[product_id] = [0, *product_details[product_id]]
+                entry[0] += quantity
+                if not entry[3]:
+                    continue
+
+                for scope in self._scopes(product_id):
+                    ranking = self._rankings.get(scope)
+                    if ranking is None:
+                        continue
+                    ranking = [item for item in ranking if item[1] != product_id]
+                    ranking.append((entry[0], product_id))
+                    ranking.sort(key=self._sort_key)
+                    self._rankings[scope] = ranking[:self.k]
+
+    def update_product(self, product):
+        """Follow category, owner or is_active changes of a tracked product."""
+        with self._lock:
+            entry = self._products.get(product.id)
+            if entry is None:
+                return
+            for scope in self._scopes(product.id):
+                self._rankings.pop(scope, None)
+            entry[1:] = [product.category_id, product.user_id, product.is_active]
+            for scope in self._scopes(product.id):
+                self._rankings.pop(scope, None)
+
+    def remove(self, product_id):
+        with self._lock:
+            if product_id not in self._products:
+                return
+            for scope in self._scopes(product_id):
+                self._rankings.pop(scope, None)
+            del self._products[product_id]
+
+    def top(self, category_id=None, agent_id=None, limit=10):
+        """
+        Best sellers as [(product_id, ordered_times)], best first.
+        Filter by category or agent; with neither, the overall ranking.
+        """
+        self._ensure_loaded()
+        if category_id is not None:
+            scope = ('category', category_id)
+        elif agent_id is not None:
+            scope = ('agent', agent_id)
+        else:
+            scope = ('all',)
+
+        with self._lock:
+            ranking = self._rankings.get(scope)
+            if ranking is None:
+                ranking = self._rankings[scope] = self._compute(scope)
+            return [(product_id, ordered_times) for ordered_times, product_id in ranking[:limit]]
+
+
+best_sellers = BestSellers()
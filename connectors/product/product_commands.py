@@ -0,0 +1,53 @@
+import click
+from sqlalchemy import update
+from models import db
+from models.products import Product, ProductReview
+from . import products
+from .recommendations import rebuild_recommendations, TOP_N, MIN_SUPPORT
+
+BACKFILL_BATCH_SIZE = 1000
+
+# flask products backfill-ratings
+@products.cli.command('backfill-ratings')
+def backfill_ratings():
+    """
+    Recompute rated_times and sum_rated on every product from product_reviews.
+    Run once after deploying the rating aggregates; review writes keep them current afterwards.
+    """
+    try:
+        stats = db.session.query(
+            ProductReview.product_id,
+            db.func.count(ProductReview.star_rating),
+            db.func.coalesce(db.func.sum(ProductReview.star_rating), 0),
+        ).group_by(ProductReview.product_id).all()
+
+        # Products without reviews go back to zero, the rest are set from the aggregate
+        Product.query.update({Product.rated_times: 0, Product.sum_rated: 0}, synchronize_session=False)
+        rows = [
+            {"id": product_id, "rated_times": rated_times, "sum_rated": sum_rated}
+            for product_id, rated_times, sum_rated in stats
+        ]
+        for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+            db.session.execute(update(Product), rows[start:start + BACKFILL_BATCH_SIZE])
+
+        db.session.commit()
+        click.echo(f"Backfilled rating aggregates for {len(rows)} reviewed products.")
+    except Exception as e:
+        db.session.rollback()
+        raise click.ClickException(f"An error occurred: {str(e)}")
+
+# flask products build-recommendations
+@products.cli.command('build-recommendations')
+@click.option('--top-n', default=TOP_N, show_default=True, help='Neighbours stored per product.')
+@click.option('--min-support', default=MIN_SUPPORT, show_default=True,
+              help='Fewest completed transactions two products must share.')
+def build_recommendations(top_n, min_support):
+    """
+    Rebuild the "frequently bought together" neighbours from completed transactions.
+    Run periodically (e.g. nightly from cron); requests only read the stored result.
+    """
+    try:
+        products_count, rows_count = rebuild_recommendations(top_n, min_support)
+        click.echo(f"Stored {rows_count} recommendations for {products_count} products.")
+    except Exception as e:
+        raise click.ClickException(f"An error occurred: {str(e)}")
@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import math
+from flask import request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import insert
+from models import db
+from models.products import Product, Category
+from models.users import User
+from . import products
+from .search_index import search_index
+from .catalog_cache import catalog_cache
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+MERCHANT_ROLES = ('pedagang', 'agen')
+
+
+def import_format():
+    """Detect 'csv' or 'jsonl' from ?format=, the uploaded filename or the content type."""
+    explicit = request.args.get('format', '').lower()
+    if explicit in ('csv', 'jsonl'):
+        return explicit
+    upload = request.files.get('file')
+    name = (upload.filename or '').lower() if upload else ''
+    mimetype = (upload.mimetype if upload else request.mimetype) or ''
+    if name.endswith('.csv') or mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')) or mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+        return 'jsonl'
+    return None
+
+
+def iter_rows(stream, file_format):
+    """
+    Yield (row_number, dict or parse error) from the upload without reading it all into memory.
+    Malformed CSV rows and JSON lines that are not UTF-8 come back as errors for that row; a CSV
+    that is not UTF-8 raises UnicodeDecodeError, since its rows cannot be told apart.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        row_number = 0
+        while True:
+            row_number += 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield row_number, ValueError(f'Invalid CSV: {e}')
+                continue
+            yield row_number, row
+
+    for row_number, raw_line in enumerate(stream, start=1):
+        try:
+            line = raw_line.decode('utf-8-sig' if row_number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            yield row_number, ValueError('Line is not valid UTF-8')
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f'Invalid JSON: {e}')
+            continue
+        yield row_number, row if isinstance(row, dict) else ValueError('Each line must be a JSON object')
+
+
+def validate_row(row, user_id, category_ids):
+    """Return the insert values for a row, or raise ValueError with the reason it was rejected."""
+    product_name = str(row.get('product_name') or '').strip()
+    description = str(row.get('description') or '').strip()
+    image_url = str(row.get('image_url') or '').strip()
+    try:
+        price = float(row.get('price') or 0)
+        stock = int(row.get('stock') or 0)
+        category_id = int(row['category_id']) if row.get('category_id') not in (None, '') else None
+        is_active = int(row.get('is_active') if row.get('is_active') not in (None, '') else 1)
+    except (TypeError, ValueError):
+        raise ValueError('price, stock, category_id and is_active must be numbers')
+
+    if not product_name or category_id is None or not math.isfinite(price) or price <= 0 or stock < 0:
+        raise ValueError('Invalid or missing required fields')
+    if is_active not in (0, 1):
+        raise ValueError('is_active must be 0 or 1')
+    if category_id not in category_ids:
+        raise ValueError(f'Category {category_id} not found')
+
+    return {
+        'user_id': user_id,
+        'product_name': product_name,
+        'description': description,
+        'price': price,
+        'stock': stock,
+        'category_id': category_id,
+        'image_url': image_url,
+        'is_active': is_active,
+    }
+
+
+@products.route('/import_products', methods=['POST'])
+@jwt_required()
+def import_products():
+    """
+    Bulk import products for the current merchant from a CSV or JSON-lines upload.
+    Send the file as multipart field `file` or as the raw request body.
+    Columns/keys: product_name, description, price, stock, category_id, image_url, is_active.
+    Valid rows are inserted in batches and committed together; invalid rows are reported.
+    """
+    identity = get_jwt_identity()
+    user = User.query.filter_by(id=identity).first() if identity else None
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    if user.role not in MERCHANT_ROLES:
+        return jsonify({'error': 'Only merchants can import products'}), 403
+
+    file_format = import_format()
+    if not file_format:
+        return jsonify({'error': 'Unsupported format, upload a .csv or .jsonl file or pass ?format=csv|jsonl'}), 400
+
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+
+    category_ids = {category_id for category_id, in db.session.query(Category.id)}
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+    touched_categories = set()
+
+    try:
+        for row_number, row in iter_rows(stream, file_format):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                values = validate_row(row, user.id, category_ids)
+            except ValueError as e:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'row': row_number, 'error': str(e)})
+                continue
+
+            batch.append(values)
+            touched_categories.add(values['category_id'])
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                db.session.execute(insert(Product), batch)
+                imported += len(batch)
+                batch = []
+
+        if batch:
+            db.session.execute(insert(Product), batch)
+            imported += len(batch)
+
+        db.session.commit()
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({'error': 'File must be UTF-8 encoded'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'An error occurred: {str(e)}'}), 500
+
+    if imported:
+        search_index.invalidate()
+        catalog_cache.bump(('catalog',), ('agent', user.id), *[('category', category_id) for category_id in touched_categories])
+
+    return jsonify({
+        'message': 'Import finished',
+        'imported': imported,
+        'failed': failed,
+        'errors': errors,
+    }), 201 if imported else 400
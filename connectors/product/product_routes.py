@@ -1,12 +1,67 @@
 from flask import request, jsonify
+from datetime import datetime
 from models import db
-from models.products import Product, ProductReview, Promotion
+from models.products import Product, ProductReview, Promotion, ProductRecommendation
 from models.users import User
 from models.products import Category
 from models.transactions import TransactionItems
+from models.pagination import fetch_page, keyset_paginate, InvalidCursor
+from models.fields import parse_fields, select_columns, InvalidFields, is_integer
 from . import products
+from .search_index import search_index
+from .catalog_cache import catalog_cache
+from .leaderboard import best_sellers, TOP_K
+from .recommendations import TOP_N as RECOMMENDATIONS_TOP_N
+from connectors.promotion.promotion_index import promotion_index
+from connectors.streaming import wants_stream, stream_json_array
+from .conditional import conditional, catalog_validator, categories_validator, product_validator
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+CATALOG_FIELDS = (*Product.SPARSE_FIELDS, 'promotion')
+
+def catalog_query(query, fields):
+    """Restrict a product listing query to the columns behind the requested fields."""
+    if fields is None:
+        return query
+    return query.options(select_columns(Product, fields, Product.SPARSE_FIELDS))
+
+def serialize_catalog(products, fields=None):
+    """
+    Serialize products with their currently active promotion attached.
+    Promotions for the whole list come from one promotion index lookup.
+    With `fields`, only those keys are returned; promotion is skipped unless requested.
+    """
+    with_promotion = fields is None or 'promotion' in fields
+    product_fields = None if fields is None else [field for field in fields if field != 'promotion']
+    promotions = promotion_index.active_for([product.id for product in products]) if with_promotion else {}
+    response_data = []
+    for product in products:
+        product_data = product.to_dict(product_fields)
+        if with_promotion:
+            promotion = promotions.get(product.id)
+            product_data['promotion'] = promotion.to_dict() if promotion else None
+        response_data.append(product_data)
+    return response_data
+
+REVIEW_PREVIEW_LIMIT = 5
+
+def serialize_reviews(reviews):
+    """Serialize product reviews with author names fetched in one batched query."""
+    user_ids = {review.user_id for review in reviews}
+    users = User.query.filter(User.id.in_(user_ids)).all() if user_ids else []
+    user_names = {user.id: user.fullname for user in users}
+    return [
+        {
+            "id": review.id,
+            "user_id": review.user_id,
+            "user_fullname": user_names.get(review.user_id, "Unknown"),
+            "review_text": review.review_text,
+            "star_rating": review.star_rating,
+            "created_at": review.created_at
+        }
+        for review in reviews
+    ]
+
 @products.route('/test', methods=['GET'])
 def test_product():
     return jsonify({'message': 'Product route is working!'}), 200
@@ -45,12 +100,14 @@ def add_product():
         )
         db.session.add(new_product)
         db.session.commit()
+        search_index.update(new_product)
+        catalog_cache.bump_product(new_product)
 
         return jsonify({'message': 'Product added successfully', 'product': {
             'id': new_product.id,
             'product_name': new_product.product_name,
             'description': new_product.description,
-            'price': float(new_product.price),
+            'price': new_product.price,
             'stock': new_product.stock,
             'category_id': new_product.category_id,
             'image_url': new_product.image_url,
@@ -89,6 +146,8 @@ def update_product(product_id):
     if not product_name or category_id is None or price <= 0 or stock < 0:
         return jsonify({'error': 'Invalid or missing required fields'}), 400
 
+    old_category_id = product.category_id
+
     try:
         # Update the product details
         product.product_name = product_name
@@ -100,12 +159,15 @@ def update_product(product_id):
         product.is_active = is_active
 
         db.session.commit()
+        search_index.update(product)
+        catalog_cache.bump_product(product, old_category_id)
+        best_sellers.update_product(product)
 
         return jsonify({'message': 'Product updated successfully', 'product': {
             'id': product.id,
             'product_name': product.product_name,
             'description': product.description,
-            'price': float(product.price),
+            'price': product.price,
             'stock': product.stock,
             'category_id': product.category_id,
             'image_url': product.image_url,
@@ -117,6 +179,112 @@ def update_product(product_id):
         db.session.rollback()
         return jsonify({'error': f'An error occurred: {str(e)}'}), 500
 
+BULK_UPDATE_MAX_ENTRIES = 5000
+
+@products.route('/bulk_update', methods=['PUT'])
+@jwt_required()
+def bulk_update_products():
+    """
+    Update stock and/or price of many products in one transaction.
+    Request Body:
+    {
+        "updates": [
+            {"product_id": 1, "stock_delta": 10},
+            {"product_id": 2, "stock": 50, "price": 12000}
+        ]
+    }
+    The batch is all-or-nothing: any invalid entry rejects the whole request.
+    """
+    identity = get_jwt_identity()
+    user = User.query.filter_by(id=identity).first() if identity else None
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    data = request.get_json() or {}
+    updates = data.get('updates')
+    if not isinstance(updates, list) or not updates:
+        return jsonify({'error': 'updates must be a non-empty list'}), 400
+    if len(updates) > BULK_UPDATE_MAX_ENTRIES:
+        return jsonify({'error': f'At most {BULK_UPDATE_MAX_ENTRIES} updates per request'}), 400
+
+    product_ids = [entry.get('product_id') if isinstance(entry, dict) else None for entry in updates]
+
+    try:
+        # Ownership and current stock for every product in one query, locked until commit
+        rows = Product.query.with_entities(Product.id, Product.user_id, Product.category_id, Product.stock) \
+            .filter(Product.id.in_([product_id for product_id in product_ids if is_integer(product_id)])) \
+            .with_for_update().all()
+        found = {row.id: row for row in rows}
+
+        errors = []
+        stock_values = {}
+        price_values = {}
+        seen = set()
+        for index, (entry, product_id) in enumerate(zip(updates, product_ids)):
+            if not is_integer(product_id):
+                errors.append({'index': index, 'product_id': product_id, 'error': 'product_id must be an integer'})
+                continue
+            row = found.get(product_id)
+            if row is None:
+                errors.append({'index': index, 'product_id': product_id, 'error': 'Product not found'})
+                continue
+            if row.user_id != user.id:
+                errors.append({'index': index, 'product_id': product_id, 'error': 'You are not authorized to edit this product'})
+                continue
+            if product_id in seen:
+                errors.append({'index': index, 'product_id': product_id, 'error': 'Duplicate product_id'})
+                continue
+            seen.add(product_id)
+
+            stock, stock_delta, price = entry.get('stock'), entry.get('stock_delta'), entry.get('price')
+            if stock is not None and stock_delta is not None:
+                errors.append({'index': index, 'product_id': product_id, 'error': 'Use either stock or stock_delta, not both'})
+                continue
+            if stock is None and stock_delta is None and price is None:
+                errors.append({'index': index, 'product_id': product_id, 'error': 'Nothing to update'})
+                continue
+            if any(value is not None and not is_integer(value) for value in (stock, stock_delta)):
+                errors.append({'index': index, 'product_id': product_id, 'error': 'stock and stock_delta must be integers'})
+                continue
+            if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float)) or price <= 0):
+                errors.append({'index': index, 'product_id': product_id, 'error': 'price must be a number greater than 0'})
+                continue
+
+            new_stock = stock if stock is not None else (row.stock + stock_delta if stock_delta is not None else None)
+            if new_stock is not None and new_stock < 0:
+                errors.append({'index': index, 'product_id': product_id, 'error': 'Stock cannot go below 0', 'stock': row.stock})
+                continue
+
+            if stock is not None:
+                stock_values[product_id] = db.literal(stock)
+            elif stock_delta is not None:
+                stock_values[product_id] = Product.stock + stock_delta
+            if price is not None:
+                price_values[product_id] = db.literal(float(price))
+
+        if errors:
+            db.session.rollback()
+            return jsonify({'error': 'No products were updated', 'errors': errors}), 400
+
+        # One set-based UPDATE for the whole batch
+        values = {Product.updated_at: datetime.utcnow()}
+        if stock_values:
+            values[Product.stock] = db.case(stock_values, value=Product.id, else_=Product.stock)
+        if price_values:
+            values[Product.price] = db.case(price_values, value=Product.id, else_=Product.price)
+        updated = Product.query.filter(Product.id.in_(list(seen))).update(values, synchronize_session=False)
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'An error occurred: {str(e)}'}), 500
+
+    if price_values:
+        search_index.invalidate()
+    catalog_cache.bump(('catalog',), ('agent', user.id), *{('category', found[product_id].category_id) for product_id in seen})
+
+    return jsonify({'message': 'Products updated successfully', 'updated': updated}), 200
+
 
 # @products.route('/all_products', methods=['GET'])
 # def get_products():
@@ -124,30 +292,36 @@ def update_product(product_id):
 #     return jsonify({'products': [product.to_dict() for product in products]}), 200
 
 @products.route('/all_products', methods=['GET'])
+@conditional(catalog_validator)
+@catalog_cache.cached(lambda: [('catalog',), promotion_index.window_scope()])
 def get_products():
     try:
         # Fetch all products
-        all_products = Product.query.all()
+        fields = parse_fields(request.args.get('fields'), CATALOG_FIELDS)
+
+        # ?stream=1 writes the full catalog batch by batch instead of building it in memory
+        if wants_stream():
+            return stream_json_array(
+                catalog_query(Product.query, fields), Product,
+                lambda batch: serialize_catalog(batch, fields),
+                prefix='{"next_cursor": null, "products": [', suffix=']}'
+            )
+
+        all_products, next_cursor = fetch_page(catalog_query(Product.query, fields), Product, request.args)
         
         # Prepare the response with promotions
-        response_data = []
-        for product in all_products:
-            # Fetch the promotion for the current product
-            promotion = Promotion.query.filter_by(product_id=product.id).first()
-            promotion_data = promotion.to_dict() if promotion else None
-
-            # Append product with its promotion details
-            product_data = product.to_dict()
-            product_data['promotion'] = promotion_data
-            response_data.append(product_data)
+        response_data = serialize_catalog(all_products, fields)
 
-        return jsonify({'products': response_data}), 200
+        return jsonify({'products': response_data, 'next_cursor': next_cursor}), 200
 
+    except (InvalidCursor, InvalidFields) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'An error occurred while fetching products.', 'details': str(e)}), 500
 
 
 @products.route('/category_products/<int:category_id>', methods=['GET'])
+@catalog_cache.cached(lambda category_id: [('category', category_id), promotion_index.window_scope()])
 def get_category_products(category_id):
     print(f"Fetching products for category ID: {category_id}")
     
@@ -158,25 +332,93 @@ def get_category_products(category_id):
         return jsonify({'error': 'Category not found'}), 404
 
     # Fetch products for the given category
-    products = Product.query.filter_by(category_id=category_id).all()
-    print(f"Products found: {products}")
+    try:
+        fields = parse_fields(request.args.get('fields'), CATALOG_FIELDS)
+        products, next_cursor = fetch_page(
+            catalog_query(Product.query.filter_by(category_id=category_id), fields), Product, request.args
+        )
+    except (InvalidCursor, InvalidFields) as e:
+        return jsonify({'error': str(e)}), 400
+    print(f"Products found: {len(products)}")
 
     # Prepare the response with promotion data
-    response_products = []
-    for product in products:
-        # Find promotion related to the product
-        promotion = Promotion.query.filter_by(product_id=product.id).first()
-        product_data = product.to_dict()
-        product_data['promotion'] = promotion.to_dict() if promotion else None
-        response_products.append(product_data)
+    response_products = serialize_catalog(products, fields)
 
     return jsonify({
         'category_name': category.category_name,
-        'products': response_products
+        'products': response_products,
+        'next_cursor': next_cursor
     }), 200
 
 
     
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+@products.route('/search', methods=['GET'])
+def search_products():
+    """
+    Ranked search over product name and description.
+    Query params: q (required), category_id, min_price, max_price, is_active, limit, offset.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Search query q is required'}), 400
+
+    limit = min(max(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    try:
+        results = search_index.search(
+            query,
+            category_id=request.args.get('category_id', type=int),
+            min_price=request.args.get('min_price', type=float),
+            max_price=request.args.get('max_price', type=float),
+            is_active=request.args.get('is_active', type=int),
+        )
+
+        # Only the requested page of ids is loaded from the database, in rank order
+        page = results[offset:offset + limit]
+        page_ids = [product_id for product_id, _ in page]
+        found = {product.id: product for product in Product.query.filter(Product.id.in_(page_ids)).all()} if page_ids else {}
+        page_products = [found[product_id] for product_id in page_ids if product_id in found]
+
+        response_data = serialize_catalog(page_products)
+        scores = dict(page)
+        for product_data in response_data:
+            product_data['score'] = round(scores[product_data['id']], 4)
+
+        return jsonify({'total': len(results), 'products': response_data}), 200
+
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while searching products.', 'details': str(e)}), 500
+
+@products.route('/top', methods=['GET'])
+def get_top_products():
+    """
+    Best selling products by completed order quantity.
+    Query params: category_id or agen_id (optional), limit (default 10, max 50).
+    """
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), TOP_K)
+        ranking = best_sellers.top(
+            category_id=request.args.get('category_id', type=int),
+            agent_id=request.args.get('agen_id', type=int),
+            limit=limit,
+        )
+
+        ranked_ids = [product_id for product_id, _ in ranking]
+        found = {product.id: product for product in Product.query.filter(Product.id.in_(ranked_ids)).all()} if ranked_ids else {}
+        response_data = serialize_catalog([found[product_id] for product_id in ranked_ids if product_id in found])
+        ordered_times = dict(ranking)
+        for product_data in response_data:
+            product_data['ordered_times'] = ordered_times[product_data['id']]
+
+        return jsonify({'products': response_data}), 200
+
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while fetching top products.', 'details': str(e)}), 500
+
 # @products.route('/product/<product_id>', methods=['GET'])
 # def get_product(product_id):
 #     product = Product.query.get(product_id)
@@ -236,6 +478,7 @@ def get_category_products(category_id):
 #         return jsonify({'error': 'An error occurred while fetching the product.', 'details': str(e)}), 500
 
 @products.route('/product/<int:product_id>', methods=['GET'])
+@conditional(product_validator)
 def get_product(product_id):
     try:
         # Fetch product by ID
@@ -251,27 +494,17 @@ def get_product(product_id):
         shop = User.query.filter_by(id=product.user_id).first()
         shop_name = shop.fullname if shop else None
 
-        # Fetch reviews for the product
-        reviews = ProductReview.query.filter_by(product_id=product_id).all()
-        review_list = [
-            {
-                "user_id": review.user_id,
-                "user_fullname": User.query.get(review.user_id).fullname if User.query.get(review.user_id) else "Unknown",
-                "review_text": review.review_text,
-                "star_rating": review.star_rating,
-                "created_at": review.created_at.isoformat() if review.created_at else None
-            }
-            for review in reviews
-        ]
+        # Preview of the latest reviews; the full list is paged by /product/<id>/reviews
+        reviews = ProductReview.query.filter_by(product_id=product_id) \
+            .order_by(ProductReview.created_at.desc(), ProductReview.id.desc()) \
+            .limit(REVIEW_PREVIEW_LIMIT).all()
+        review_list = serialize_reviews(reviews)
 
-        # Calculate average star rating
-        average_rating = (
-            sum([review.star_rating for review in reviews]) / len(reviews)
-            if reviews else 0
-        )
+        # Average star rating from the aggregates kept on the product
+        average_rating = product.average_rating
 
         # Fetch promotion for the product
-        promotion = Promotion.query.filter_by(product_id=product_id).first()
+        promotion = promotion_index.active_for([product_id]).get(product_id)
         promotion_details = promotion.to_dict() if promotion else None
 
         return jsonify({
@@ -280,7 +513,8 @@ def get_product(product_id):
             'product': product.to_dict(),
             'reviews': {
                 'details': review_list,
-                'average_rating': average_rating
+                'average_rating': average_rating,
+                'rated_times': product.rated_times or 0
             },
             'promotion': promotion_details
         }), 200
@@ -289,6 +523,58 @@ def get_product(product_id):
         return jsonify({'error': 'An error occurred while fetching the product.', 'details': str(e)}), 500
 
 
+@products.route('/product/<int:product_id>/recommendations', methods=['GET'])
+def get_product_recommendations(product_id):
+    """
+    Products frequently bought together with this one, best match first.
+    Serves the neighbours stored by `flask products build-recommendations`.
+    Query params: limit (default 10, max 20).
+    """
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), RECOMMENDATIONS_TOP_N)
+        rows = db.session.query(Product, ProductRecommendation.co_purchases, ProductRecommendation.score) \
+            .join(ProductRecommendation, ProductRecommendation.recommended_product_id == Product.id) \
+            .filter(ProductRecommendation.product_id == product_id, Product.is_active == 1) \
+            .order_by(ProductRecommendation.rank) \
+            .limit(limit).all()
+
+        response_data = serialize_catalog([product for product, _, _ in rows])
+        for product_data, (_, co_purchases, score) in zip(response_data, rows):
+            product_data['co_purchases'] = co_purchases
+            product_data['score'] = score
+
+        return jsonify({'product_id': product_id, 'recommendations': response_data}), 200
+
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while fetching recommendations.', 'details': str(e)}), 500
+
+@products.route('/product/<int:product_id>/reviews', methods=['GET'])
+def get_product_reviews(product_id):
+    """
+    Page through a product's reviews, newest first.
+    Query params: limit, after (next_cursor from the previous page).
+    """
+    try:
+        product = Product.query.get(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+
+        reviews, next_cursor = keyset_paginate(
+            ProductReview.query.filter_by(product_id=product_id), ProductReview,
+            request.args.get('limit', type=int), request.args.get('after'), descending=True
+        )
+
+        return jsonify({
+            'product_id': product_id,
+            'reviews': serialize_reviews(reviews),
+            'average_rating': product.average_rating,
+            'next_cursor': next_cursor
+        }), 200
+
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while fetching reviews.', 'details': str(e)}), 500
     
     
 # categories
@@ -305,9 +591,12 @@ def add_category():
     new_category = Category(category_name=category_name, description=description, image_url=image_url)
     db.session.add(new_category)
     db.session.commit()
+    catalog_cache.bump(('categories',))
 
     return jsonify({'message': 'Category added successfully'}), 201
 @products.route('/categories', methods=['GET'])
+@conditional(categories_validator)
+@catalog_cache.cached(lambda: [('categories',)])
 def get_categories():
     categories = Category.query.all()
     return jsonify({'categories': [{'id': category.id, 'category_name': category.category_name, 'description': category.description, 'image_url': category.image_url} for category in categories]}), 200
@@ -321,31 +610,34 @@ def get_category(category_id):
 
 # semua product yang dibuat oleh sebuah agen
 @products.route('/agen_products/<int:agen_id>', methods=['GET'])
+@catalog_cache.cached(lambda agen_id: [('agent', agen_id), promotion_index.window_scope()])
 def get_agen_products(agen_id):
     try:
         # Fetch products for the given agent (user ID)
-        products = Product.query.filter_by(user_id=agen_id).all()
         agen = User.query.filter_by(id=agen_id).first()
 
         if not agen:
             return jsonify({'error': 'Agent not found'}), 404
 
-        if not products:
+        fields = parse_fields(request.args.get('fields'), CATALOG_FIELDS)
+        products, next_cursor = fetch_page(
+            catalog_query(Product.query.filter_by(user_id=agen_id), fields), Product, request.args
+        )
+
+        if not products and not request.args.get('after'):
             return jsonify({'error': 'Products not found'}), 404
 
         # Add promotions for each product
-        product_list = []
-        for product in products:
-            promotion = Promotion.query.filter_by(product_id=product.id).first()
-            product_data = product.to_dict()
-            product_data['promotion'] = promotion.to_dict() if promotion else None
-            product_list.append(product_data)
+        product_list = serialize_catalog(products, fields)
 
         return jsonify({
             'market_name': agen.fullname,
-            'products': product_list
+            'products': product_list,
+            'next_cursor': next_cursor
         }), 200
 
+    except (InvalidCursor, InvalidFields) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'An error occurred while fetching agent products.', 'details': str(e)}), 500
 
@@ -369,6 +661,9 @@ def delete_product(product_id):
         # Delete the product
         db.session.delete(product)
         db.session.commit()
+        search_index.remove(product_id)
+        catalog_cache.bump_product(product)
+        best_sellers.remove(product_id)
         return jsonify({'message': 'Product deleted successfully'}), 200
     except Exception as e:
         db.session.rollback()
@@ -441,6 +736,8 @@ def add_product_review():
 
         if not item_id:
             return jsonify({"error": "Item ID is required."}), 400
+        if star_rating is not None and not (is_integer(star_rating) and 1 <= star_rating <= 5):
+            return jsonify({"error": "star_rating must be an integer from 1 to 5."}), 400
 
         # Get current user ID from JWT
         current_user_id = get_jwt_identity()
@@ -466,7 +763,13 @@ def add_product_review():
             star_rating=star_rating
         )
         db.session.add(new_review)
+
+        # Keep the product's rating aggregates in step with the review
+        if star_rating is not None:
+            product.add_rating(star_rating)
+
         db.session.commit()
+        catalog_cache.bump_product(product)
 
         return jsonify({"message": "Review added successfully."}), 201
 
@@ -0,0 +1,101 @@
+from datetime import datetime
+from sqlalchemy import insert
+from models import db
+from models.products import ProductRecommendation
+from models.transactions import Transaction, TransactionItems, COMPLETED_STATUSES
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # declared in pyproject.toml; only needed to build recommendations
+    np = sparse = None
+
+TOP_N = 20
+MIN_SUPPORT = 2
+INSERT_BATCH_SIZE = 1000
+
+
+def co_purchase_neighbours(transaction_ids, product_ids, top_n=TOP_N, min_support=MIN_SUPPORT):
+    """
+    Rank products bought together, from one (transaction_id, product_id) pair per purchased line.
+    Baskets become a sparse transactions x products matrix B; B.T @ B counts, for every
+    product pair, the transactions containing both. Pairs are scored by cosine similarity
+    count / sqrt(baskets with i * baskets with j), so best sellers do not top every list.
+    :param min_support: Fewest shared transactions for a pair to be kept.
+    :return: Arrays (product_id, recommended_product_id, rank, co_purchases, score), rank starting at 1.
+    """
+    transaction_ids = np.asarray(transaction_ids)
+    product_ids = np.asarray(product_ids)
+    empty = (np.empty(0, dtype=np.int64),) * 4 + (np.empty(0),)
+    if product_ids.size == 0:
+        return empty
+
+    _, basket_rows = np.unique(transaction_ids, return_inverse=True)
+    products, product_columns = np.unique(product_ids, return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(basket_rows.size, dtype=np.int32), (basket_rows, product_columns)),
+        shape=(basket_rows.max() + 1, products.size),
+    )
+    # A product listed twice in one transaction still counts once
+    baskets.sum_duplicates()
+    baskets.data[:] = 1
+
+    purchases = np.asarray(baskets.sum(axis=0)).ravel()
+    pairs = (baskets.T @ baskets).tocoo()
+    keep = (pairs.row != pairs.col) & (pairs.data >= min_support)
+    source, target, counts = pairs.row[keep], pairs.col[keep], pairs.data[keep]
+    if source.size == 0:
+        return empty
+    scores = counts / np.sqrt(purchases[source].astype(np.float64) * purchases[target])
+
+    # Group by source product, best score first; ties by shared count, then product id
+    order = np.lexsort((products[target], -counts, -scores, source))
+    source, target, counts, scores = source[order], target[order], counts[order], scores[order]
+    group_starts = np.flatnonzero(np.r_[True, source[1:] != source[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, source.size])
+    ranks = np.arange(source.size) - np.repeat(group_starts, group_sizes) + 1
+
+    top = ranks <= top_n
+    return products[source[top]], products[target[top]], ranks[top], counts[top], scores[top]
+
+
+def rebuild_recommendations(top_n=TOP_N, min_support=MIN_SUPPORT):
+    """
+    Recompute product_recommendations from completed transactions, replacing the stored
+    neighbours in one database transaction. Needs an app context and numpy/scipy.
+    :return: (number of products with neighbours, number of stored rows)
+    """
+    if np is None:
+        raise RuntimeError("Building recommendations needs numpy and scipy: poetry install")
+
+    lines = db.session.query(TransactionItems.transaction_id, TransactionItems.product_id) \
+        .join(Transaction, Transaction.id == TransactionItems.transaction_id) \
+        .filter(Transaction.status.in_(COMPLETED_STATUSES)).all()
+    transaction_ids = np.fromiter((line[0] for line in lines), dtype=np.int64, count=len(lines))
+    product_ids = np.fromiter((line[1] for line in lines), dtype=np.int64, count=len(lines))
+
+    source, target, ranks, counts, scores = co_purchase_neighbours(transaction_ids, product_ids, top_n, min_support)
+    now = datetime.utcnow()
+    rows = [
+        {
+            "product_id": product_id,
+            "recommended_product_id": recommended_product_id,
+            "rank": rank,
+            "co_purchases": co_purchases,
+            "score": score,
+            "created_at": now,
+        }
+        for product_id, recommended_product_id, rank, co_purchases, score in zip(
+            source.tolist(), target.tolist(), ranks.tolist(), counts.tolist(), scores.tolist()
+        )
+    ]
+
+    try:
+        db.session.query(ProductRecommendation).delete(synchronize_session=False)
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            db.session.execute(insert(ProductRecommendation), rows[start:start + INSERT_BATCH_SIZE])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(set(source.tolist())), len(rows)
@@ -0,0 +1,178 @@
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from models.products import Product
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Matches in the product name count more than matches in the description
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def tokenize(text):
+    """Lowercase word tokens of a text."""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class ProductSearchIndex:
+    """
+    In-process inverted index over product_name and description.
+    Built lazily from the database on first search, then kept current by the
+    product write routes. Each worker process holds its own copy, so it is also
+    rebuilt after `refresh_seconds` to pick up writes made by other workers.
+    Only one thread rebuilds at a time; while it does, other searches keep using
+    the expired index instead of each starting a rebuild of their own.
+    """
+
+    def __init__(self, refresh_seconds=300):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._built_at = None
+        self._pending = None  # writes seen while a rebuild reads the table, replayed onto it
+        self._invalidations = 0
+        self._postings = defaultdict(dict)  # token -> {product_id: weighted term frequency}
+        self._documents = {}  # product_id -> (tokens, category_id, price, is_active)
+
+    def _index_document(self, product_id, product_name, description, category_id, price, is_active):
+        weights = defaultdict(float)
+        for token in tokenize(product_name):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(description):
+            weights[token] += DESCRIPTION_WEIGHT
+
+        for token, weight in weights.items():
+            self._postings[token][product_id] = weight
+        self._documents[product_id] = (tuple(weights), category_id, price, is_active)
+
+    def _unindex_document(self, product_id):
+        document = self._documents.pop(product_id, None)
+        if not document:
+            return
+        for token in document[0]:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    def rebuild(self):
+        """Rebuild the whole index from the products table. Needs an app context."""
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._pending = []
+            invalidations = self._invalidations
+        try:
+            rows = Product.query.with_entities(
+                Product.id, Product.product_name, Product.description,
+                Product.category_id, Product.price, Product.is_active
+            ).all()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._documents = {}
+            for row in rows:
+                self._index_document(*row)
+            # Writes that landed after the table was read
+            for product_id, document in self._pending:
+                self._unindex_document(product_id)
+                if document is not None:
+                    self._index_document(product_id, *document)
+            self._pending = None
+            # An invalidate() during the rebuild may cover writes the read missed
+            self._built_at = time.monotonic() if self._invalidations == invalidations else None
+
+    def _is_stale(self):
+        return self._built_at is None or time.monotonic() - self._built_at > self.refresh_seconds
+
+    def _ensure_fresh(self):
+        if not self._is_stale():
+            return
+        if self._built_at is None:
+            # Nothing to serve yet: wait for whoever is building, then build only if still needed
+            with self._rebuild_lock:
+                if self._is_stale():
+                    self._rebuild()
+        elif self._rebuild_lock.acquire(blocking=False):
+            try:
+                if self._is_stale():
+                    self._rebuild()
+            finally:
+                self._rebuild_lock.release()
+
+    def invalidate(self):
+        """Force a rebuild on the next search, e.g. after a bulk write."""
+        with self._lock:
+            self._built_at = None
+            self._invalidations += 1
+
+    def update(self, product):
+        """Index a new or changed product. No-op until the index has been built."""
+        document = (
+            product.product_name, product.description,
+            product.category_id, product.price, product.is_active
+        )
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((product.id, document))
+            if self._built_at is None:
+                return
+            self._unindex_document(product.id)
+            self._index_document(product.id, *document)
+
+    def remove(self, product_id):
+        """Drop a deleted product from the index."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((product_id, None))
+            if self._built_at is None:
+                return
+            self._unindex_document(product_id)
+
+    def search(self, query, category_id=None, min_price=None, max_price=None, is_active=None):
+        """
+        Rank products matching any query token, scored by weighted TF-IDF.
+        :return: List of (product_id, score), best match first.
+        """
+        self._ensure_fresh()
+        tokens = set(tokenize(query))
+
+        with self._lock:
+            total_documents = len(self._documents) or 1
+            scores = defaultdict(float)
+            for token in tokens:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + total_documents / len(postings))
+                for product_id, weight in postings.items():
+                    scores[product_id] += weight * idf
+
+            results = []
+            for product_id, score in scores.items():
+                _, product_category_id, price, product_is_active = self._documents[product_id]
+                if category_id is not None and product_category_id != category_id:
+                    continue
+                if min_price is not None and price < min_price:
+                    continue
+                if max_price is not None and price > max_price:
+                    continue
+                if is_active is not None and product_is_active != is_active:
+                    continue
+                results.append((product_id, score))
+
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results
+
+
+search_index = ProductSearchIndex()
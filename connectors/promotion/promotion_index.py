@@ -0,0 +1,134 @@
+import threading
+import time
+from datetime import datetime
+from models.products import Promotion
+
+PROMOTION_COLUMNS = (
+    'id', 'product_id', 'user_id', 'transaction_id', 'scheme', 'scheme_percentage',
+    'description', 'start_date', 'end_date', 'created_at', 'updated_at',
+)
+
+
+class PromotionSnapshot:
+    """Detached copy of a Promotion row, safe to keep across requests and sessions."""
+    __slots__ = PROMOTION_COLUMNS
+
+    def __init__(self, promotion):
+        for column in PROMOTION_COLUMNS:
+            setattr(self, column, getattr(promotion, column))
+
+    to_dict = Promotion.to_dict
+
+    def is_active(self, at):
+        """Active on the half-open window [start_date, end_date); open ends are unbounded."""
+        return (self.start_date is None or self.start_date <= at) and (self.end_date is None or at < self.end_date)
+
+
+def active_promotions(product_ids, at=None):
+    """
+    Return {product_id: Promotion} with the first promotion active at `at` (default: now)
+    for each of the given products, read from the database in one query. Payments use this
+    instead of promotion_index, which can be up to `refresh_seconds` behind other workers' writes.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    at = at or datetime.utcnow()
+    result = {}
+    for promotion in Promotion.query.filter(
+        Promotion.product_id.in_(product_ids),
+        (Promotion.start_date.is_(None)) | (Promotion.start_date <= at),
+        (Promotion.end_date.is_(None)) | (Promotion.end_date > at),
+    ).order_by(Promotion.id):
+        result.setdefault(promotion.product_id, promotion)
+    return result
+
+
+class PromotionIndex:
+    """
+    In-memory index of product promotions and their validity windows.
+    The set of promotions active right now is precomputed together with the
+    next start/end boundary, so lookups for the current time are dict reads
+    until that boundary passes. Promotion write routes call invalidate(); the
+    index is also reloaded after `refresh_seconds` to pick up other workers' writes.
+    """
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._by_product = {}  # product_id -> [PromotionSnapshot] ordered by id
+        self._active = {}  # product_id -> PromotionSnapshot active in the current window
+        self._window_end = None  # next start/end boundary after the current window began
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _load(self):
+        """Reload promotions from the database. Needs an app context."""
+        now = datetime.utcnow()
+        promotions = Promotion.query.filter(
+            Promotion.product_id.isnot(None),
+            (Promotion.end_date.is_(None)) | (Promotion.end_date > now),
+        ).order_by(Promotion.id).all()
+
+        by_product = {}
+        for promotion in promotions:
+            by_product.setdefault(promotion.product_id, []).append(PromotionSnapshot(promotion))
+
+        with self._lock:
+            self._by_product = by_product
+            self._loaded_at = time.monotonic()
+            self._roll_window(now)
+
+    def _roll_window(self, now):
+        active = {}
+        window_end = None
+        for product_id, snapshots in self._by_product.items():
+            for snapshot in snapshots:
+                if snapshot.is_active(now):
+                    active.setdefault(product_id, snapshot)
+                for boundary in (snapshot.start_date, snapshot.end_date):
+                    if boundary is not None and boundary > now and (window_end is None or boundary < window_end):
+                        window_end = boundary
+        self._active = active
+        self._window_end = window_end
+
+    def _ensure_current(self, now):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            self._load()
+        elif self._window_end is not None and now >= self._window_end:
+            with self._lock:
+                self._roll_window(now)
+
+    def window_scope(self):
+        """
+        Scope naming the current validity window, for cache keys and ETags.
+        It changes whenever a promotion starts or ends.
+        """
+        self._ensure_current(datetime.utcnow())
+        return ('promotion_window', self._window_end)
+
+    def active_for(self, product_ids, at=None):
+        """
+        Return {product_id: PromotionSnapshot} with the first promotion active at `at`
+        (default: now) for each of the given products. Promotions that had already
+        ended when the index was loaded are not kept, so `at` should not be in the past.
+        """
+        self._ensure_current(datetime.utcnow())
+
+        with self._lock:
+            if at is None:
+                return {product_id: self._active[product_id] for product_id in product_ids if product_id in self._active}
+
+            result = {}
+            for product_id in product_ids:
+                for snapshot in self._by_product.get(product_id, ()):
+                    if snapshot.is_active(at):
+                        result[product_id] = snapshot
+                        break
+            return result
+
+
+promotion_index = PromotionIndex()
@@ -3,13 +3,22 @@ from . import promotion
 from flask import Flask, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
-from models.products import Promotion
+from models.products import Promotion, Product
 from models import db
+from connectors.product.catalog_cache import catalog_cache
+from .promotion_index import promotion_index
 
 @promotion.route('/', methods=['GET'])
 def test_promotions():
     return jsonify({'message': 'Promo route is working!'}), 200
 
+def invalidate_promotion_products(*product_ids):
+    """Invalidate the promotion index and cached catalog listings showing the promoted products."""
+    promotion_index.invalidate()
+    products = Product.query.filter(Product.id.in_({product_id for product_id in product_ids if product_id})).all()
+    for product in products:
+        catalog_cache.bump_product(product)
+
 @promotion.route('/handle_promotion', methods=['GET', 'POST', 'PUT', 'DELETE'])
 @jwt_required()
 def handle_promotions():
@@ -36,6 +45,7 @@ def handle_promotions():
             )
             db.session.add(promotion)
             db.session.commit()
+            invalidate_promotion_products(promotion.product_id)
             return jsonify({'message': 'Promotion created successfully', 'promotion': promotion.to_dict()}), 201
         except Exception as e:
             return jsonify({'error': str(e)}), 400
@@ -51,6 +61,8 @@ def handle_promotions():
         if not promotion:
             return jsonify({'error': 'Promotion not found or not authorized'}), 404
 
+        old_product_id = promotion.product_id
+
         try:
             promotion.product_id = data.get('product_id', promotion.product_id)
             promotion.transaction_id = data.get('transaction_id', promotion.transaction_id)
@@ -61,6 +73,7 @@ def handle_promotions():
             promotion.end_date = datetime.fromisoformat(data.get('end_date')) if data.get('end_date') else promotion.end_date
 
             db.session.commit()
+            invalidate_promotion_products(old_product_id, promotion.product_id)
             return jsonify({'message': 'Promotion updated successfully', 'promotion': promotion.to_dict()}), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 400
@@ -76,9 +89,12 @@ def handle_promotions():
         if not promotion:
             return jsonify({'error': 'Promotion not found or not authorized'}), 404
 
+        product_id = promotion.product_id
+
         try:
             db.session.delete(promotion)
             db.session.commit()
+            invalidate_promotion_products(product_id)
             return jsonify({'message': 'Promotion deleted successfully'}), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 400
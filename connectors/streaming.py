@@ -0,0 +1,50 @@
+from flask import current_app, request, stream_with_context
+from models.pagination import keyset_paginate, MAX_PAGE_LIMIT
+
+STREAM_BATCH_SIZE = MAX_PAGE_LIMIT
+
+
+def wants_stream(args=None):
+    """True when the request asked for a streamed full listing with ?stream=1 and no page parameters."""
+    args = request.args if args is None else args
+    if 'limit' in args or 'after' in args:
+        return False
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def iter_batches(query, model, batch_size=STREAM_BATCH_SIZE):
+    """
+    Iterate a query in lists of rows, one keyset page at a time.
+    Each batch is a complete, buffered query, so batch serializers can run their own
+    lookups in between; an open server-side cursor (yield_per) would keep the
+    connection busy until the whole result had been read.
+    """
+    after = None
+    while True:
+        batch, after = keyset_paginate(query, model, batch_size, after)
+        if batch:
+            yield batch
+        if after is None:
+            return
+
+
+def stream_json_array(query, model, serialize_batch, prefix='[', suffix=']'):
+    """
+    Stream a JSON array of a query's rows without holding the result in memory.
+    :param serialize_batch: Function turning a list of rows into a list of JSON-able dicts.
+    :param prefix: Text before the array items, e.g. '{"products": ['.
+    :param suffix: Text after the array items, e.g. ']}'.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield prefix
+        separator = ''
+        for batch in iter_batches(query, model):
+            chunk = ','.join(dumps(item) for item in serialize_batch(batch))
+            if chunk:
+                yield separator + chunk
+                separator = ','
+        yield suffix
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
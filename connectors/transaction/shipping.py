@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from flask import current_app
+from geopy.distance import geodesic
+from connectors.geo import np, haversine_km_many, parse_location
+
+DEFAULT_CACHE_MAX_ENTRIES = 10000
+DEFAULT_CACHE_TTL_SECONDS = 300
+# Decimals kept of the delivery coordinates; 4 decimals is a cell of about 11 m
+DEFAULT_CACHE_PRECISION = 4
+
+# Per-km tariff by trip distance: (up to km, rate per km); longer trips pay SHIPPING_RATE_BEYOND
+SHIPPING_TIERS = ((1, 8000), (2, 6000), (3, 5000))
+SHIPPING_RATE_BEYOND = 4000
+MIN_SHIPPING_COST = 5000
+
+
+def shipping_cost(distance_km):
+    """Shipping cost of one trip: the tier's per-km rate times the distance, at least MIN_SHIPPING_COST."""
+    rate = next((rate for limit_km, rate in SHIPPING_TIERS if distance_km <= limit_km), SHIPPING_RATE_BEYOND)
+    return max(round(distance_km * rate, 0), MIN_SHIPPING_COST)
+
+
+def shipping_costs(distances_km):
+    """shipping_cost() over a NumPy array of distances at once."""
+    if np is None:
+        return [shipping_cost(distance_km) for distance_km in distances_km]
+
+    distances_km = np.asarray(distances_km, dtype=np.float64)
+    rates = np.select(
+        [distances_km <= limit_km for limit_km, _ in SHIPPING_TIERS],
+        [rate for _, rate in SHIPPING_TIERS],
+        SHIPPING_RATE_BEYOND,
+    )
+    return np.maximum(np.round(distances_km * rates), MIN_SHIPPING_COST)
+
+
+def quote_shipping(location, market_points):
+    """
+    Estimated distances and shipping costs from a delivery location to several markets in one pass.
+    The amount charged comes from charged_shipping().
+    :param location: (lat, lng) of the delivery address.
+    :param market_points: List of (lat, lng), one per market.
+    :return: List of (distance_km, shipping_cost) in the order of `market_points`.
+    """
+    if not market_points:
+        return []
+    lats, lngs = zip(*market_points)
+    distances_km = haversine_km_many(location[0], location[1], lats, lngs)
+    costs = shipping_costs(distances_km)
+    return [(float(distance_km), float(cost)) for distance_km, cost in zip(distances_km, costs)]
+
+
+def charged_shipping(location, market_point):
+    """
+    Distance and shipping cost charged for one trip, on the geodesic (WGS-84) distance
+    the shipping cost has always been billed on. quote_shipping()'s spherical distance
+    differs by up to about 0.5%, enough to move a trip across a tier boundary, so it
+    is only used for quotes.
+    :return: (distance_km, shipping_cost)
+    """
+    distance_km = geodesic(location, market_point).kilometers
+    return distance_km, shipping_cost(distance_km)
+
+
+class ShippingQuoteCache:
+    """
+    LRU cache of shipping quotes keyed by (agent_id, version, delivery cell).
+    Delivery coordinates are rounded to SHIPPING_QUOTE_PRECISION decimals and the
+    quote is computed from the rounded point, so every address in a cell gets the
+    same quote. An agent's entries are dropped when its location changes; the TTL
+    bounds staleness from changes made in other worker processes, unless callers
+    pass the agent's stored location as `version`, which makes such changes miss.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (agent_id, version, cell) -> (created_at, (distance_km, shipping_cost))
+        self._keys_by_agent = defaultdict(set)
+        self.hits = 0
+        self.misses = 0
+
+    def cell(self, location):
+        precision = current_app.config.get('SHIPPING_QUOTE_PRECISION', DEFAULT_CACHE_PRECISION)
+        return round(location[0], precision), round(location[1], precision)
+
+    def get(self, agent_id, cell, version=None):
+        ttl = current_app.config.get('SHIPPING_QUOTE_CACHE_TTL_SECONDS', DEFAULT_CACHE_TTL_SECONDS)
+        key = (agent_id, version, cell)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, agent_id, cell, quote, version=None):
+        max_entries = current_app.config.get('SHIPPING_QUOTE_CACHE_MAX_ENTRIES', DEFAULT_CACHE_MAX_ENTRIES)
+        key = (agent_id, version, cell)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), quote)
+            self._entries.move_to_end(key)
+            self._keys_by_agent[agent_id].add(key)
+            while len(self._entries) > max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._forget(evicted_key)
+
+    def _forget(self, key):
+        keys = self._keys_by_agent.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_agent[key[0]]
+
+    def invalidate_agent(self, agent_id):
+        """Drop an agent's quotes, e.g. after its location changed."""
+        with self._lock:
+            for key in self._keys_by_agent.pop(agent_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_agent.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+shipping_quote_cache = ShippingQuoteCache()
+# Geodesic costs as charged by /delivery_location, kept apart from the spherical estimates
+shipping_charge_cache = ShippingQuoteCache()
+
+
+def charge_market(location, agent_id, stored_location):
+    """
+    Distance and shipping cost charged for a delivery from a market, from shipping_charge_cache
+    where possible. charged_shipping() is applied to the delivery cell, so every address in a
+    cell is charged the same whether or not the charge was cached. Entries are keyed on the
+    market's stored location, so a market that moved is never charged from an old entry, even
+    when another worker process recorded the move.
+    :param stored_location: The market's location as stored on the user row.
+    :return: (distance_km, shipping_cost), or None when the stored location is invalid.
+    """
+    cell = shipping_charge_cache.cell(location)
+    charge = shipping_charge_cache.get(agent_id, cell, version=stored_location)
+    if charge is None:
+        market_point = parse_location(stored_location)
+        if market_point is None:
+            return None
+        charge = charged_shipping(cell, market_point)
+        shipping_charge_cache.set(agent_id, cell, charge, version=stored_location)
+    return charge
+
+
+def quote_markets(location, agent_ids, load_locations):
+    """
+    Quotes from a delivery location to markets, from the cache where possible.
+    Misses are computed together in one quote_shipping() pass and cached.
+    Quotes are spherical estimates and can be a TTL old; the amount charged comes
+    from charge_market().
+    :param load_locations: Function of a list of agent ids returning {agent_id: stored location};
+        only called with the ids that missed the cache.
+    :return: ({agent_id: (distance_km, shipping_cost)}, {agent_id: error message})
+    """
+    cell = shipping_quote_cache.cell(location)
+    quotes, errors, missing = {}, {}, []
+    for agent_id in dict.fromkeys(agent_ids):
+        quote = shipping_quote_cache.get(agent_id, cell)
+        if quote is None:
+            missing.append(agent_id)
+        else:
+            quotes[agent_id] = quote
+    if not missing:
+        return quotes, errors
+
+    stored = load_locations(missing)
+    points = {}
+    for agent_id in missing:
+        if not stored.get(agent_id):
+            errors[agent_id] = 'Agent location not found'
+        elif (point := parse_location(stored[agent_id])) is None:
+            errors[agent_id] = 'Invalid agent location format'
+        else:
+            points[agent_id] = point
+
+    for agent_id, quote in zip(points, quote_shipping(cell, list(points.values()))):
+        shipping_quote_cache.set(agent_id, cell, quote)
+        quotes[agent_id] = quote
+    return quotes, errors
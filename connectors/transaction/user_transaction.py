@@ -5,15 +5,89 @@ from models import db
 from flask_jwt_extended import get_jwt_identity, jwt_required
 from werkzeug.security import check_password_hash
 from models.users import User
-from models.transactions import Transaction
+from models.transactions import Transaction, COMPLETED_STATUSES, COMPLETABLE_STATUSES
 from models.transactions import TransactionItems
 from models.transactions import Delivery
 from models.products import Promotion, Product, ProductReview
-from geopy.distance import geodesic
 from decimal import Decimal
+from models.pagination import fetch_page, InvalidCursor
+from models.fields import parse_fields, select_columns, InvalidFields, is_integer, parse_id
+from connectors.streaming import wants_stream, stream_json_array
+from connectors.promotion.promotion_index import promotion_index, active_promotions
+from connectors.product.leaderboard import best_sellers
+from connectors.geo import parse_location
+from .shipping import charge_market, quote_markets, shipping_quote_cache, shipping_charge_cache
 
 # Create a Blueprint for transaction related routes
 
+def count_completed_sales(transaction):
+    """
+    Add the transaction's item quantities to Product.ordered_times in one UPDATE.
+    Call before committing the status change to 'completed'; pass the result to
+    best_sellers.record_sales() after the commit.
+    :return: ({product_id: quantity}, {product_id: (category_id, user_id, is_active)})
+    """
+    quantities = {}
+    for item in TransactionItems.query.filter_by(transaction_id=transaction.id).all():
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        return {}, {}
+
+    Product.query.filter(Product.id.in_(list(quantities))).update({
+        Product.ordered_times: db.func.coalesce(Product.ordered_times, 0)
+            + db.case(quantities, value=Product.id, else_=0),
+    }, synchronize_session=False)
+
+    details = {
+        product_id: (category_id, user_id, is_active)
+        for product_id, category_id, user_id, is_active in Product.query.with_entities(
+            Product.id, Product.category_id, Product.user_id, Product.is_active
+        ).filter(Product.id.in_(list(quantities)))
+    }
+    return quantities, details
+
+def transition_status(transaction, status):
+    """
+    Move the transaction to `status` only if it still has the status it was loaded with,
+    so two concurrent requests can't both act on the same transition.
+    :return: False if another request changed the status first.
+    """
+    updated = Transaction.query.filter(
+        Transaction.id == transaction.id, Transaction.status == transaction.status
+    ).update({Transaction.status: status}, synchronize_session=False)
+    return updated == 1
+
+def reopens_completed(transaction, status):
+    """
+    True when `status` would move a completed transaction back into the order flow,
+    from where /update_status_completed would pay its market and driver again.
+    """
+    return transaction.status in COMPLETED_STATUSES and status not in COMPLETED_STATUSES
+
+def group_transactions_by_consumer(transactions):
+    """
+    Group serialized transactions by consumer (from_user_id).
+    Consumers and transaction details are loaded in batched queries.
+    :param transactions: List of Transaction instances.
+    :return: List of consumer groups for JSON serialization.
+    """
+    consumer_ids = {transaction.from_user_id for transaction in transactions}
+    consumers = User.query.filter(User.id.in_(consumer_ids)).all() if consumer_ids else []
+    consumer_names = {consumer.id: consumer.fullname for consumer in consumers}
+
+    grouped_transactions = {}
+    for transaction, transaction_data in zip(transactions, Transaction.bulk_to_dict(transactions)):
+        consumer_id = transaction.from_user_id
+        if consumer_id not in grouped_transactions:
+            grouped_transactions[consumer_id] = {
+                "consumer_id": consumer_id,
+                "consumer_name": consumer_names.get(consumer_id, "Unknown"),
+                "transactions": [],
+            }
+        grouped_transactions[consumer_id]["transactions"].append(transaction_data)
+
+    return list(grouped_transactions.values())
+
 @transactions.route('/', methods=['GET'])
 def transaction():
     return '<div>Transaction</div>'
@@ -65,13 +139,24 @@ def get_transaction():
     :return: JSON response with transaction data.
     """
     try:
-        transactions = Transaction.query.all()
+        fields = parse_fields(request.args.get("fields"), list(Transaction.SPARSE_FIELDS))
+        query = Transaction.query
+        if fields:
+            query = query.options(select_columns(Transaction, fields, Transaction.SPARSE_FIELDS))
+
+        # ?stream=1 writes the transactions batch by batch instead of building the list in memory
+        if wants_stream():
+            return stream_json_array(query, Transaction, lambda batch: Transaction.bulk_to_dict(batch, fields))
+
+        transactions = query.all()
 
         if not transactions:
             return jsonify({"error": "No transactions found."}), 404
 
-        return jsonify([transaction.to_dict() for transaction in transactions]), 200
+        return jsonify(Transaction.bulk_to_dict(transactions, fields)), 200
 
+    except InvalidFields as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": "An error occurred while fetching transactions.", "details": str(e)}), 500
 
@@ -112,10 +197,16 @@ def get_transaction_detail(transaction_id):
     transaction_dict = transaction.to_dict()
     transaction_dict["items"] = []
 
-    for item in transaction.transaction_items:
-        # Fetch the related product for this item
-        product = Product.query.get(item.product_id)
-        promotion = Promotion.query.filter_by(product_id=product.id).first() if product else None
+    # Fetch the related products in one query and their active promotions from the index
+    items = transaction.transaction_items
+    product_ids = {item.product_id for item in items}
+    products = Product.query.filter(Product.id.in_(product_ids)).all() if product_ids else []
+    products_by_id = {product.id: product for product in products}
+    promotions = promotion_index.active_for(product_ids)
+
+    for item in items:
+        product = products_by_id.get(item.product_id)
+        promotion = promotions.get(item.product_id) if product else None
 
         # Append item details including product and promotion
         transaction_dict["items"].append({
@@ -200,23 +291,7 @@ def get_transactions_by_consumer(agent_id):
             return jsonify({"message": "No transactions found for this agent."}), 404
 
         # Group transactions by consumers (from_user_id)
-        grouped_transactions = {}
-        for transaction in transactions:
-            consumer_id = transaction.from_user_id
-            if consumer_id not in grouped_transactions:
-                # Add consumer to the group with their details
-                consumer = User.query.get(consumer_id)
-                grouped_transactions[consumer_id] = {
-                    "consumer_id": consumer_id,
-                    "consumer_name": consumer.fullname if consumer else "Unknown",
-                    "transactions": [],
-                }
-            
-            # Add the transaction to the consumer's group
-            grouped_transactions[consumer_id]["transactions"].append(transaction.to_dict())
-
-        # Convert the grouped transactions to a list for JSON serialization
-        grouped_transactions_list = list(grouped_transactions.values())
+        grouped_transactions_list = group_transactions_by_consumer(transactions)
 
         return jsonify({"grouped_transactions": grouped_transactions_list}), 200
 
@@ -239,23 +314,7 @@ def get_transactions_by_consumer_ordered(agent_id):
             return jsonify({"message": "No transactions found for this agent."}), 404
 
         # Group transactions by consumers (from_user_id)
-        grouped_transactions = {}
-        for transaction in transactions:
-            consumer_id = transaction.from_user_id
-            if consumer_id not in grouped_transactions:
-                # Add consumer to the group with their details
-                consumer = User.query.get(consumer_id)
-                grouped_transactions[consumer_id] = {
-                    "consumer_id": consumer_id,
-                    "consumer_name": consumer.fullname if consumer else "Unknown",
-                    "transactions": [],
-                }
-            
-            # Add the transaction to the consumer's group
-            grouped_transactions[consumer_id]["transactions"].append(transaction.to_dict())
-
-        # Convert the grouped transactions to a list for JSON serialization
-        grouped_transactions_list = list(grouped_transactions.values())
+        grouped_transactions_list = group_transactions_by_consumer(transactions)
 
         return jsonify({"grouped_transactions": grouped_transactions_list}), 200
 
@@ -278,23 +337,7 @@ def get_transactions_by_consumer_completed(agent_id):
             return jsonify({"message": "No transactions found for this agent."}), 404
 
         # Group transactions by consumers (from_user_id)
-        grouped_transactions = {}
-        for transaction in transactions:
-            consumer_id = transaction.from_user_id
-            if consumer_id not in grouped_transactions:
-                # Add consumer to the group with their details
-                consumer = User.query.get(consumer_id)
-                grouped_transactions[consumer_id] = {
-                    "consumer_id": consumer_id,
-                    "consumer_name": consumer.fullname if consumer else "Unknown",
-                    "transactions": [],
-                }
-            
-            # Add the transaction to the consumer's group
-            grouped_transactions[consumer_id]["transactions"].append(transaction.to_dict())
-
-        # Convert the grouped transactions to a list for JSON serialization
-        grouped_transactions_list = list(grouped_transactions.values())
+        grouped_transactions_list = group_transactions_by_consumer(transactions)
 
         return jsonify({"grouped_transactions": grouped_transactions_list}), 200
 
@@ -318,23 +361,7 @@ def get_transactions_by_consumer_processed(agent_id):
         
 
         # Group transactions by consumers (from_user_id)
-        grouped_transactions = {}
-        for transaction in transactions:
-            consumer_id = transaction.from_user_id
-            if consumer_id not in grouped_transactions:
-                # Add consumer to the group with their details
-                consumer = User.query.get(consumer_id)
-                grouped_transactions[consumer_id] = {
-                    "consumer_id": consumer_id,
-                    "consumer_name": consumer.fullname if consumer else "Unknown",
-                    "transactions": [],
-                }
-            
-            # Add the transaction to the consumer's group
-            grouped_transactions[consumer_id]["transactions"].append(transaction.to_dict())
-
-        # Convert the grouped transactions to a list for JSON serialization
-        grouped_transactions_list = list(grouped_transactions.values())
+        grouped_transactions_list = group_transactions_by_consumer(transactions)
 
         return jsonify({"grouped_transactions": grouped_transactions_list}), 200
 
@@ -358,23 +385,7 @@ def get_transactions_by_consumer_taken(agent_id):
         
 
         # Group transactions by consumers (from_user_id)
-        grouped_transactions = {}
-        for transaction in transactions:
-            consumer_id = transaction.from_user_id
-            if consumer_id not in grouped_transactions:
-                # Add consumer to the group with their details
-                consumer = User.query.get(consumer_id)
-                grouped_transactions[consumer_id] = {
-                    "consumer_id": consumer_id,
-                    "consumer_name": consumer.fullname if consumer else "Unknown",
-                    "transactions": [],
-                }
-            
-            # Add the transaction to the consumer's group
-            grouped_transactions[consumer_id]["transactions"].append(transaction.to_dict())
-
-        # Convert the grouped transactions to a list for JSON serialization
-        grouped_transactions_list = list(grouped_transactions.values())
+        grouped_transactions_list = group_transactions_by_consumer(transactions)
 
         return jsonify({"grouped_transactions": grouped_transactions_list}), 200
 
@@ -399,23 +410,7 @@ def get_transactions_by_consumer_taken_driver(agent_id, driver_id):
         
 
         # Group transactions by consumers (from_user_id)
-        grouped_transactions = {}
-        for transaction in transactions:
-            consumer_id = transaction.from_user_id
-            if consumer_id not in grouped_transactions:
-                # Add consumer to the group with their details
-                consumer = User.query.get(consumer_id)
-                grouped_transactions[consumer_id] = {
-                    "consumer_id": consumer_id,
-                    "consumer_name": consumer.fullname if consumer else "Unknown",
-                    "transactions": [],
-                }
-            
-            # Add the transaction to the consumer's group
-            grouped_transactions[consumer_id]["transactions"].append(transaction.to_dict())
-
-        # Convert the grouped transactions to a list for JSON serialization
-        grouped_transactions_list = list(grouped_transactions.values())
+        grouped_transactions_list = group_transactions_by_consumer(transactions)
 
         return jsonify({"grouped_transactions": grouped_transactions_list}), 200
 
@@ -440,6 +435,9 @@ def assign_driver():
         # Validate input
         if not transaction_id or not driver_id:
             return jsonify({"error": "Both transaction_id and driver_id are required."}), 400
+        transaction_id = parse_id(transaction_id)
+        if transaction_id is None:
+            return jsonify({"error": "transaction_id must be a positive integer."}), 400
 
         # Fetch the transaction
         transaction = Transaction.query.get(transaction_id)
@@ -462,9 +460,14 @@ def assign_driver():
         if status != 'taken':
             return jsonify({"error": "Invalid status. Only 'taken' is allowed."}), 400
 
+        if reopens_completed(transaction, status):
+            return jsonify({"error": "The transaction is already completed."}), 409
+
         # Assign the driver and update status
         transaction.driver_id = driver_id
-        transaction.status = status
+        if not transition_status(transaction, status):
+            db.session.rollback()
+            return jsonify({"error": "Transaction status was changed by another request, please retry."}), 409
         db.session.commit()
 
         return jsonify({
@@ -493,39 +496,28 @@ def update_delivery_location():
 
         if not transaction_id or not location:
             return jsonify({'error': 'Missing required fields'}), 400
+        transaction_id = parse_id(transaction_id)
+        if transaction_id is None:
+            return jsonify({"error": "transaction_id must be a positive integer."}), 400
 
         # Fetch the transaction
         transaction = Transaction.query.get(transaction_id)
         if not transaction:
             return jsonify({'error': 'Transaction not found'}), 404
 
-        # Fetch the agent (to_user_id is the agent ID)
-        agent = User.query.filter_by(id=transaction.to_user_id, role='agen').first()
-        if not agent or not agent.location:
-            return jsonify({'error': 'Agent location not found'}), 404
+        user_location = parse_location(location)
+        if user_location is None:
+            return jsonify({'error': 'Invalid location format'}), 400
 
-        # Calculate the distance
-        user_location = (location['lat'], location['lng'])
-        try:
-            agent_location = json.loads(agent.location)  # Agent location should be stored as JSON in DB
-            agent_coords = (agent_location['lat'], agent_location['lng'])
-            distance_km = geodesic(user_location, agent_coords).kilometers
-        except (KeyError, TypeError, ValueError) as e:
-            return jsonify({'error': 'Invalid agent location format', 'details': str(e)}), 400
-
-        # Calculate shipping cost (e.g., 5000 per km)
-        if distance_km <= 1:
-            cost_per_km = 8000;
-        elif distance_km <= 2:
-            cost_per_km = 6000;
-        elif distance_km <= 3:
-            cost_per_km = 5000;
-        else:
-            cost_per_km = 4000; 
-            
-        shipping_cost = round(distance_km * cost_per_km, 0)
-        if shipping_cost < 5000:
-            shipping_cost = 5000
+        # Charged on the geodesic distance from the agent's (to_user_id) current location;
+        # repeat deliveries to the same cell are served from the charge cache
+        agent_location = load_market_locations([transaction.to_user_id]).get(transaction.to_user_id)
+        if not agent_location:
+            return jsonify({'error': 'Agent location not found'}), 404
+        charge = charge_market(user_location, transaction.to_user_id, agent_location)
+        if charge is None:
+            return jsonify({'error': 'Invalid agent location format'}), 400
+        distance_km, shipping_cost = charge
 
         # Update transaction with user location and shipping cost
         transaction.user_location = json.dumps(location)
@@ -544,6 +536,89 @@ def update_delivery_location():
         print("Error updating delivery location and shipping cost:", e)
         return jsonify({'error': 'An error occurred', 'details': str(e)}), 500
 
+MAX_SHIPPING_QUOTES = 100
+
+def load_market_locations(agent_ids):
+    """Stored location of each market (role 'agen') among agent_ids, in one query."""
+    return dict(User.query.with_entities(User.id, User.location).filter(
+        User.id.in_(agent_ids), User.role == 'agen'
+    ).all())
+
+@transactions.route('/shipping_quote', methods=['POST'])
+@jwt_required()
+def shipping_quote():
+    """
+    Estimated shipping costs from one delivery location to several markets, computed in one pass.
+    Estimates use the spherical distance while /delivery_location charges on the geodesic one, so
+    a charge can differ slightly, at a tier boundary by a whole tier; every cost returned here is
+    therefore marked "estimated": true.
+    Body: {"location": {"lat": .., "lng": ..}, "transaction_ids": [..]} for the caller's
+    transactions, and/or "agent_ids": [..] for markets directly.
+    """
+    try:
+        data = request.get_json() or {}
+        location = parse_location(data.get('location'))
+        transaction_ids = data.get('transaction_ids') or []
+        agent_ids = data.get('agent_ids') or []
+
+        if location is None:
+            return jsonify({'error': 'A location with valid lat and lng is required'}), 400
+        if not isinstance(transaction_ids, list) or not isinstance(agent_ids, list) \
+                or not all(is_integer(value) for value in transaction_ids + agent_ids):
+            return jsonify({'error': 'transaction_ids and agent_ids must be lists of ids'}), 400
+        if not transaction_ids and not agent_ids:
+            return jsonify({'error': 'transaction_ids or agent_ids is required'}), 400
+        if len(transaction_ids) + len(agent_ids) > MAX_SHIPPING_QUOTES:
+            return jsonify({'error': f'At most {MAX_SHIPPING_QUOTES} quotes per request'}), 400
+
+        # One entry per requested transaction or market, in request order
+        entries = [{'agent_id': agent_id} for agent_id in agent_ids]
+        if transaction_ids:
+            owned = Transaction.query.with_entities(Transaction.id, Transaction.to_user_id).filter(
+                Transaction.id.in_(transaction_ids), Transaction.from_user_id == get_jwt_identity()
+            ).all()
+            markets_by_transaction = dict(owned)
+            entries = [
+                {'transaction_id': transaction_id, 'agent_id': markets_by_transaction.get(transaction_id)}
+                for transaction_id in transaction_ids
+            ] + entries
+
+        # Cached quotes skip the market query and the distance computation
+        quotes, errors = quote_markets(
+            location, [entry['agent_id'] for entry in entries if entry['agent_id'] is not None], load_market_locations
+        )
+
+        total_shipping_cost = 0
+        for entry in entries:
+            if entry['agent_id'] is None:
+                entry['error'] = 'Transaction not found'
+            elif entry['agent_id'] in errors:
+                entry['error'] = errors[entry['agent_id']]
+            else:
+                distance_km, cost = quotes[entry['agent_id']]
+                entry['distance_km'] = round(distance_km, 2)
+                entry['shipping_cost'] = cost
+                entry['estimated'] = True
+                total_shipping_cost += cost
+
+        return jsonify({
+            'quotes': entries,
+            'total_shipping_cost': total_shipping_cost,
+            'estimated': True,
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while quoting shipping', 'details': str(e)}), 500
+
+@transactions.route('/shipping_quote/stats', methods=['GET'])
+@jwt_required()
+def shipping_quote_stats():
+    """Hit rate of this worker process's shipping quote cache, and of its charge cache under "charges". Admins only."""
+    user = User.query.get(get_jwt_identity())
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Only admins can view cache statistics'}), 403
+    return jsonify({**shipping_quote_cache.stats(), 'charges': shipping_charge_cache.stats()}), 200
+
 @transactions.route('/update_description', methods=['PUT'])
 @jwt_required()
 def update_transaction_description():
@@ -554,6 +629,9 @@ def update_transaction_description():
 
         if not transaction_id or not description:
             return jsonify({'error': 'Missing required fields'}), 400
+        transaction_id = parse_id(transaction_id)
+        if transaction_id is None:
+            return jsonify({"error": "transaction_id must be a positive integer."}), 400
 
         # Fetch the transaction
         transaction = Transaction.query.get(transaction_id)
@@ -587,6 +665,9 @@ def update_transaction_status():
         # Validate input
         if not transaction_id or not status:
             return jsonify({"error": "Both transaction_id and status are required."}), 400
+        transaction_id = parse_id(transaction_id)
+        if transaction_id is None:
+            return jsonify({"error": "transaction_id must be a positive integer."}), 400
 
         # Get current user ID from JWT
         current_user_id = get_jwt_identity()
@@ -601,12 +682,22 @@ def update_transaction_status():
         if not transaction:
             return jsonify({"error": "Transaction not found."}), 404
 
-        # Optional: Add additional status change validation if needed
-        # For example, prevent certain status changes based on current status
+        # A completed transaction stays completed, so it can't be completed and paid out twice
+        if reopens_completed(transaction, status):
+            return jsonify({"error": "A completed transaction cannot move back to another status."}), 409
+
+        # Count sales once, on the transition into 'completed'
+        sales = None
+        if status == "completed" and transaction.status not in COMPLETED_STATUSES:
+            sales = count_completed_sales(transaction)
         
         # Update the status
-        transaction.status = status
+        if not transition_status(transaction, status):
+            db.session.rollback()
+            return jsonify({"error": "Transaction status was changed by another request, please retry."}), 409
         db.session.commit()
+        if sales:
+            best_sellers.record_sales(*sales)
 
         return jsonify({
             "message": "Transaction status updated successfully.",
@@ -633,6 +724,9 @@ def update_transaction_driver_id():
         # Validate input
         if not transaction_id or not driver_id:
             return jsonify({"error": "Both transaction_id and status are required."}), 400
+        transaction_id = parse_id(transaction_id)
+        if transaction_id is None:
+            return jsonify({"error": "transaction_id must be a positive integer."}), 400
 
         # Fetch transaction from the database
         transaction = Transaction.query.get(transaction_id)
@@ -745,6 +839,9 @@ def update_balance_and_status():
         # Validate input
         if not transaction_id or not status:
             return jsonify({"error": "Both transaction_id and status are required."}), 400
+        transaction_id = parse_id(transaction_id)
+        if transaction_id is None:
+            return jsonify({"error": "transaction_id must be a positive integer."}), 400
         
         if not amount:
             return jsonify({"error": "Amount is required"}), 400
@@ -771,16 +868,19 @@ def update_balance_and_status():
         transaction = Transaction.query.get(transaction_id)
         if not transaction:
             return jsonify({"error": "Transaction not found."}), 404
+        if reopens_completed(transaction, status):
+            return jsonify({"error": "A completed transaction cannot move back to another status."}), 409
 
         # Initialize cashback total and recalculate total_amount
         cashback_total = Decimal(0)  # Ensure cashback_total is a Decimal
         updated_total_amount = Decimal(0)  # To calculate the new total amount for the transaction
 
+        # Promotions active right now for every item, read from the database in one query
+        promotions = active_promotions({item.product_id for item in transaction.transaction_items})
+
         # Iterate through transaction items
         for item in transaction.transaction_items:
-            # Fetch the associated product and promotion
-            product = Product.query.get(item.product_id)
-            promotion = Promotion.query.filter_by(product_id=item.product_id).first()
+            promotion = promotions.get(item.product_id)
 
             if promotion:
                 if promotion.scheme == 'discount':
@@ -813,7 +913,9 @@ def update_balance_and_status():
             return jsonify({"error": "Invalid plus_minus value. Must be 'plus' or 'minus'"}), 400
 
         # Update transaction status
-        transaction.status = status
+        if not transition_status(transaction, status):
+            db.session.rollback()
+            return jsonify({"error": "Transaction status was changed by another request, please retry."}), 409
 
         # Commit changes
         db.session.commit()
@@ -822,8 +924,8 @@ def update_balance_and_status():
             "message": "Balance and transaction status updated successfully",
             "transaction_id": transaction_id,
             "new_status": status,
-            "balance": float(current_user.balance),  # Convert Decimal to float for JSON serialization
-            "updated_total_amount": float(updated_total_amount)
+            "balance": current_user.balance,
+            "updated_total_amount": updated_total_amount
         }), 200
 
     except Exception as e:
@@ -891,16 +993,22 @@ def get_transactions_by_user(user_id):
     """
     try:
         # Fetch transactions where the from_user_id matches the user_id
-        transactions = Transaction.query.filter_by(from_user_id=user_id).all()
+        fields = parse_fields(request.args.get("fields"), list(Transaction.SPARSE_FIELDS))
+        query = Transaction.query.filter_by(from_user_id=user_id)
+        if fields:
+            query = query.options(select_columns(Transaction, fields, Transaction.SPARSE_FIELDS))
+        transactions, next_cursor = fetch_page(query, Transaction, request.args)
 
-        if not transactions:
+        if not transactions and not request.args.get("after"):
             return jsonify({"message": "No transactions found for this user."}), 404
 
         # Convert transactions to dictionary format for JSON serialization
-        transactions_list = [transaction.to_dict() for transaction in transactions]
+        transactions_list = Transaction.bulk_to_dict(transactions, fields)
 
-        return jsonify({"user_id": user_id, "transactions": transactions_list}), 200
+        return jsonify({"user_id": user_id, "transactions": transactions_list, "next_cursor": next_cursor}), 200
 
+    except (InvalidCursor, InvalidFields) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print("Error fetching transactions for user:", e)
         return jsonify({"error": "An error occurred while fetching transactions.", "details": str(e)}), 500
@@ -929,6 +1037,9 @@ def update_transaction_status_completed():
         # Validate input
         if not transaction_id:
             return jsonify({"error": "Transaction ID is required."}), 400
+        transaction_id = parse_id(transaction_id)
+        if transaction_id is None:
+            return jsonify({"error": "transaction_id must be a positive integer."}), 400
 
         # Get current user ID from JWT
         current_user_id = get_jwt_identity()
@@ -943,9 +1054,23 @@ def update_transaction_status_completed():
         if not transaction:
             return jsonify({"error": "Transaction not found."}), 404
 
+        # Only an ordered, processed or taken transaction can be completed; completed ones can't
+        # move back (see reopens_completed), so its market and driver are paid once
+        if transaction.status not in COMPLETABLE_STATUSES:
+            return jsonify({
+                "error": f"A transaction in status '{transaction.status}' cannot be completed."
+            }), 409
+
+        # Update transaction status to 'completed' first, conditional on the status checked
+        # above, so a concurrent completion gets a 409 instead of crediting the balances too
+        if not transition_status(transaction, 'completed'):
+            db.session.rollback()
+            return jsonify({"error": "Transaction status was changed by another request, please retry."}), 409
+
         # Update balance for to_user_id
         to_user = User.query.get(transaction.to_user_id)
         if not to_user:
+            db.session.rollback()
             return jsonify({"error": "Recipient user not found."}), 404
 
         to_user.balance += Decimal(transaction.total_amount)
@@ -954,15 +1079,18 @@ def update_transaction_status_completed():
         if transaction.driver_id:
             driver = User.query.get(transaction.driver_id)
             if not driver:
+                db.session.rollback()
                 return jsonify({"error": "Driver user not found."}), 404
 
             driver.balance += Decimal(transaction.shipping_cost)
 
-        # Update transaction status to 'completed'
-        transaction.status = 'completed'
+        # Count sales once, on the transition into 'completed'
+        sales = count_completed_sales(transaction)
 
         # Commit changes to the database
         db.session.commit()
+        if sales:
+            best_sellers.record_sales(*sales)
 
         return jsonify({
             "message": "Transaction status updated and balances adjusted successfully.",
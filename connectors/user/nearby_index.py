@@ -0,0 +1,127 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+from models.users import User
+from connectors.geo import KM_PER_DEGREE_LAT, haversine_km, parse_location
+
+# Grid cell size; 0.05 degrees is about 5.5 km north-south
+CELL_DEGREES = 0.05
+
+
+class NearbyMarkets:
+    """
+    In-memory grid index over market (role 'agen') coordinates.
+    Markets are bucketed into square cells of `cell_degrees`; a radius query
+    only measures the markets in the cells overlapping its bounding box.
+    Kept current by the register and profile routes, and reloaded after
+    `refresh_seconds` to pick up changes made in other worker processes.
+    """
+
+    def __init__(self, cell_degrees=CELL_DEGREES, refresh_seconds=300):
+        self.cell_degrees = cell_degrees
+        self.refresh_seconds = refresh_seconds
+        self._columns = round(360 / cell_degrees)
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._cells = defaultdict(dict)  # (row, column) -> {agent_id: (lat, lng)}
+        self._points = {}  # agent_id -> (row, column)
+
+    def _column(self, column):
+        """Wrap a grid column across the antimeridian."""
+        half = self._columns // 2
+        return (column + half) % self._columns - half
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), self._column(math.floor(lng / self.cell_degrees))
+
+    def _place(self, agent_id, point):
+        self._unplace(agent_id)
+        cell = self._cell(*point)
+        self._cells[cell][agent_id] = point
+        self._points[agent_id] = cell
+
+    def _unplace(self, agent_id):
+        cell = self._points.pop(agent_id, None)
+        if cell is None:
+            return
+        members = self._cells.get(cell)
+        if members is not None:
+            members.pop(agent_id, None)
+            if not members:
+                del self._cells[cell]
+
+    def rebuild(self):
+        """Reload every market location from the users table. Needs an app context."""
+        rows = User.query.with_entities(User.id, User.location).filter(User.role == 'agen').all()
+
+        with self._lock:
+            self._cells = defaultdict(dict)
+            self._points = {}
+            for agent_id, location in rows:
+                point = parse_location(location)
+                if point is not None:
+                    self._place(agent_id, point)
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.refresh_seconds:
+            self.rebuild()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def update(self, user):
+        """Index a user's current location; non-markets and unparsable locations are dropped."""
+        point = parse_location(user.location) if user.role == 'agen' else None
+        with self._lock:
+            if self._built_at is None:
+                return
+            if point is None:
+                self._unplace(user.id)
+            else:
+                self._place(user.id, point)
+
+    def remove(self, agent_id):
+        with self._lock:
+            self._unplace(agent_id)
+
+    def nearest(self, lat, lng, radius_km, limit):
+        """
+        Markets within `radius_km` of (lat, lng), nearest first.
+        :return: List of (agent_id, distance_km), at most `limit` long.
+        """
+        self._ensure_fresh()
+
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        # A degree of longitude shrinks towards the poles
+        lng_span = min(radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-9)), 180)
+        first_row = math.floor((lat - lat_span) / self.cell_degrees)
+        last_row = math.floor((lat + lat_span) / self.cell_degrees)
+        first_column = math.floor((lng - lng_span) / self.cell_degrees)
+        last_column = min(math.floor((lng + lng_span) / self.cell_degrees), first_column + self._columns - 1)
+
+        with self._lock:
+            if (last_row - first_row + 1) * (last_column - first_column + 1) > len(self._cells):
+                # Fewer occupied cells than cells in the box: scan the occupied ones
+                cells = self._cells.values()
+            else:
+                cells = [
+                    self._cells[cell]
+                    for row in range(first_row, last_row + 1)
+                    for column in range(first_column, last_column + 1)
+                    if (cell := (row, self._column(column))) in self._cells
+                ]
+            candidates = [
+                (haversine_km(lat, lng, point[0], point[1]), agent_id)
+                for members in cells
+                for agent_id, point in members.items()
+            ]
+
+        within = (candidate for candidate in candidates if candidate[0] <= radius_km)
+        return [(agent_id, distance_km) for distance_km, agent_id in heapq.nsmallest(limit, within)]
+
+
+nearby_markets = NearbyMarkets()
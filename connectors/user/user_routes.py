@@ -2,39 +2,105 @@ from . import user
 from models.users import User
 from flask import Flask, jsonify, request
 from models import db, users
+from models.pagination import fetch_page, InvalidCursor
+from models.fields import parse_fields, select_columns, InvalidFields
+from connectors.streaming import wants_stream, stream_json_array
+from .nearby_index import nearby_markets
 from werkzeug.security import check_password_hash
 from flask_jwt_extended import jwt_required, get_jwt_identity
+import math
 
 
 @user.route('/', methods=['GET'])
 def test_user():
     return '<div>User</div>'
 
+AGENT_FIELDS = (
+    "id", "username", "fullname", "email", "balance", "phone_number",
+    "location", "image_url", "role", "created_at", "updated_at",
+)
+
+def serialize_agent(agent):
+    return {
+        "id": agent.id,
+        "username": agent.username,
+        "fullname": agent.fullname,
+        "email": agent.email,
+        "balance": agent.balance,
+        "phone_number": agent.phone_number,
+        "location": agent.location,
+        "image_url": agent.image_url,
+        "role": agent.role,
+        "created_at": agent.created_at,
+        "updated_at": agent.updated_at,
+    }
+
 # market
 # get user with 'agen' role
 @user.route('/agents', methods=['GET'])
 def get_agents():
-    agents = User.query.filter_by(role='agen').all()
+    try:
+        fields = parse_fields(request.args.get('fields'), AGENT_FIELDS)
+        query = User.query.filter_by(role='agen')
+        if fields:
+            query = query.options(select_columns(User, fields, User.SPARSE_FIELDS))
+
+        # ?stream=1 writes every agent batch by batch instead of building the list in memory
+        if wants_stream():
+            return stream_json_array(
+                query, User,
+                lambda batch: [agent.to_dict(fields) if fields else serialize_agent(agent) for agent in batch],
+                prefix='{"next_cursor": null, "agents": [', suffix=']}'
+            )
+
+        agents, next_cursor = fetch_page(query, User, request.args)
+    except (InvalidCursor, InvalidFields) as e:
+        return jsonify({'error': str(e)}), 400
     if not agents:
-        return jsonify({'agents': []}), 200
-    
-    agents_data = []
-    for agent in agents:
-        agents_data.append({
-            "id": agent.id,
-            "username": agent.username,
-            "fullname": agent.fullname,
-            "email": agent.email,
-            "balance": float(agent.balance),  # Convert Decimal to float for JSON serialization
-            "phone_number": agent.phone_number,
-            "location": agent.location,
-            "image_url": agent.image_url,
-            "role": agent.role,
-            "created_at": agent.created_at.isoformat() if agent.created_at else None,
-            "updated_at": agent.updated_at.isoformat() if agent.updated_at else None,
-        })
-    
-    return jsonify({'agents': agents_data}), 200
+        return jsonify({'agents': [], 'next_cursor': None}), 200
+
+    if fields:
+        return jsonify({'agents': [agent.to_dict(fields) for agent in agents], 'next_cursor': next_cursor}), 200
+
+    return jsonify({'agents': [serialize_agent(agent) for agent in agents], 'next_cursor': next_cursor}), 200
+
+NEARBY_DEFAULT_RADIUS_KM = 10
+NEARBY_MAX_RADIUS_KM = 50
+NEARBY_MAX_LIMIT = 100
+
+# markets near a location, nearest first
+@user.route('/agents/nearby', methods=['GET'])
+def get_nearby_agents():
+    """
+    Query params: lat, lng (required), radius in km (default 10, max 50), limit (default 20, max 100).
+    """
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', NEARBY_DEFAULT_RADIUS_KM, type=float)
+    limit = request.args.get('limit', 20, type=int)
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({'error': 'Valid lat and lng are required'}), 400
+    if not (math.isfinite(radius) and radius > 0):
+        return jsonify({'error': 'radius must be a positive number'}), 400
+
+    try:
+        nearest = nearby_markets.nearest(
+            lat, lng, min(radius, NEARBY_MAX_RADIUS_KM), min(max(limit, 1), NEARBY_MAX_LIMIT)
+        )
+        agent_ids = [agent_id for agent_id, _ in nearest]
+        agents = {agent.id: agent for agent in User.query.filter(User.id.in_(agent_ids)).all()} if agent_ids else {}
+
+        response_data = []
+        for agent_id, distance_km in nearest:
+            if agent_id in agents:
+                agent_data = serialize_agent(agents[agent_id])
+                agent_data['distance_km'] = round(distance_km, 2)
+                response_data.append(agent_data)
+
+        return jsonify({'agents': response_data}), 200
+
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while fetching nearby agents', 'details': str(e)}), 500
 
 @user.route('/topup', methods=['POST'])
 @jwt_required()
@@ -64,7 +130,7 @@ def topup_balance():
 
         return jsonify({
             "message": "Top-up successful",
-            "balance": float(user.balance)  # Convert Decimal to float
+            "balance": user.balance
         }), 200
 
     except Exception as e:
@@ -83,7 +149,7 @@ def get_balance():
             return jsonify({"error": "User not found"}), 404
 
         return jsonify({
-            "balance": float(user.balance)  # Convert Decimal to float
+            "balance": user.balance
         }), 200
 
     except Exception as e:
@@ -120,7 +186,7 @@ def update_balance():
 
         return jsonify({
             "message": "Balance updated successfully",
-            "balance": float(user.balance)  # Convert Decimal to float
+            "balance": user.balance
         }), 200
 
     except Exception as e:
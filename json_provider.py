@@ -0,0 +1,55 @@
+from datetime import date
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # declared in pyproject.toml; stdlib JSON when missing
+    orjson = None
+
+
+def encode_value(o):
+    """
+    Encode the column types JSON lacks, so to_dict() methods and routes can return them as they are:
+    datetime and date as HTTP dates (RFC 1123), as Flask has always sent them, and Decimal as a number.
+    """
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, Decimal):
+        return float(o)
+    return DefaultJSONProvider.default(o)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Standard library fallback: Flask's own provider with encode_value()."""
+
+    default = staticmethod(encode_value)
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, with the same output as JSONProvider."""
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj).decode()
+
+    def _dumps(self, obj):
+        # orjson would write datetimes as ISO 8601; pass them to encode_value() instead
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=encode_value, option=option)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps(obj) + b"\n", mimetype=self.mimetype)
+
+
+def json_provider_class(name):
+    """Provider class for the JSON_PROVIDER setting, falling back when orjson is not installed."""
+    if name == "orjson" and orjson is not None:
+        return OrjsonProvider
+    return JSONProvider
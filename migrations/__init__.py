@@ -0,0 +1,158 @@
+import importlib
+import pkgutil
+from contextlib import contextmanager
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, inspect, text
+
+MIGRATION_LOCK_NAME = 'schema_migrations'
+MIGRATION_LOCK_TIMEOUT_SECONDS = 300
+
+# Applied revisions are recorded here, outside the models' metadata
+version_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', version_metadata,
+    Column('revision', String(32), primary_key=True),
+    Column('description', String(255), nullable=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def load_migrations():
+    """
+    Migration modules in migrations/versions, ordered by file name.
+    Each module defines `revision` and `upgrade(connection)`; its docstring is the description.
+    """
+    from . import versions
+
+    return [
+        importlib.import_module(f'{versions.__name__}.{info.name}')
+        for info in sorted(pkgutil.iter_modules(versions.__path__), key=lambda info: info.name)
+    ]
+
+
+def describe(module):
+    """First line of a migration's docstring."""
+    return (module.__doc__ or '').strip().split('\n')[0]
+
+
+def applied_revisions(connection):
+    version_metadata.create_all(bind=connection, checkfirst=True)
+    return {row.revision for row in connection.execute(schema_migrations.select())}
+
+
+def pending_migrations(engine):
+    with engine.begin() as connection:
+        applied = applied_revisions(connection)
+    return [module for module in load_migrations() if module.revision not in applied]
+
+
+@contextmanager
+def migration_lock(engine):
+    """
+    Hold a database-wide advisory lock (MySQL GET_LOCK) on a connection of its own, so
+    workers starting at the same time migrate one after another. Other databases get no
+    lock; SQLite is only used by a single development process.
+    """
+    if engine.dialect.name != 'mysql':
+        yield
+        return
+    with engine.connect() as connection:
+        acquired = connection.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            {'name': MIGRATION_LOCK_NAME, 'timeout': MIGRATION_LOCK_TIMEOUT_SECONDS},
+        ).scalar()
+        if acquired != 1:
+            raise RuntimeError(f"Timed out waiting for the {MIGRATION_LOCK_NAME} lock")
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': MIGRATION_LOCK_NAME})
+
+
+def upgrade(engine, echo=None):
+    """
+    Apply pending migrations in order, each in its own transaction, under migration_lock().
+    Pending revisions are read once the lock is held, so a worker that waited for
+    another one applies nothing twice.
+    :param echo: Optional function called with a line per applied revision.
+    :return: List of applied revisions.
+    """
+    applied = []
+    with migration_lock(engine):
+        for module in pending_migrations(engine):
+            with engine.begin() as connection:
+                module.upgrade(connection)
+                connection.execute(schema_migrations.insert().values(
+                    revision=module.revision,
+                    description=describe(module),
+                    applied_at=datetime.utcnow(),
+                ))
+            applied.append(module.revision)
+            if echo:
+                echo(f"Applied {module.revision}: {describe(module)}")
+    return applied
+
+
+# Helpers for migrations: every step checks the live schema first, so a migration
+# is a no-op on a database where db.create_all() already created the object.
+
+def has_index(connection, table_name, index_name):
+    return any(index['name'] == index_name for index in inspect(connection).get_indexes(table_name))
+
+
+def create_index(connection, table_name, index_name, columns):
+    """Create an index on the reflected table unless it already exists."""
+    if not has_index(connection, table_name, index_name):
+        table = Table(table_name, MetaData(), autoload_with=connection)
+        Index(index_name, *[table.c[column] for column in columns]).create(bind=connection)
+
+
+def drop_index(connection, table_name, index_name):
+    if has_index(connection, table_name, index_name):
+        table = Table(table_name, MetaData(), autoload_with=connection)
+        next(index for index in table.indexes if index.name == index_name).drop(bind=connection)
+
+
+# flask db upgrade / flask db status / flask db check-indexes
+@click.group('db')
+def migrate_cli():
+    """Versioned schema migrations."""
+
+
+@migrate_cli.command('upgrade')
+@with_appcontext
+def upgrade_command():
+    """Apply pending schema migrations."""
+    from models import db
+
+    applied = upgrade(db.engine, echo=click.echo)
+    if not applied:
+        click.echo("Database is up to date.")
+
+
+@migrate_cli.command('status')
+@with_appcontext
+def status_command():
+    """List migrations and whether each one is applied."""
+    from models import db
+
+    with db.engine.begin() as connection:
+        applied = applied_revisions(connection)
+    for module in load_migrations():
+        state = 'applied' if module.revision in applied else 'pending'
+        click.echo(f"{module.revision}  {state:8}  {describe(module)}")
+
+
+@migrate_cli.command('check-indexes')
+def check_indexes_command():
+    """Migrate a fresh SQLite database and check the hot queries' plans use an index."""
+    from .index_check import check_hot_queries
+
+    failures = 0
+    for name, index_name, plan, ok in check_hot_queries():
+        click.echo(f"{'ok  ' if ok else 'FAIL'}  {name}: {plan}")
+        failures += not ok
+    if failures:
+        raise click.ClickException(f"{failures} hot queries do not use their index.")
@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine, select, text
+from models.products import Product, Promotion
+from models.transactions import Transaction, TransactionItems
+from models.users import User
+from . import upgrade
+
+
+def listing_page(statement, model, limit=51):
+    """A first keyset page, ordered and limited like models.pagination.keyset_paginate."""
+    return statement.order_by(model.created_at, model.id).limit(limit)
+
+
+# (route, statement, index its plan must use); the filters mirror the routes' queries
+HOT_QUERIES = (
+    ('transaction status_* listings for a market',
+     select(Transaction).where(Transaction.to_user_id == 1, Transaction.status == 'ordered'),
+     'ix_transactions_to_user_id_status'),
+    ('cart and transaction_list/user',
+     select(Transaction).where(Transaction.from_user_id == 1, Transaction.status == 'cart'),
+     'ix_transactions_from_user_id_status'),
+    ('driver transactions',
+     select(Transaction).where(Transaction.driver_id == 1, Transaction.status == 'taken'),
+     'ix_transactions_driver_id_status'),
+    ('Transaction.bulk_to_dict items',
+     select(TransactionItems).where(TransactionItems.transaction_id.in_([1, 2, 3])),
+     'ix_transaction_items_transaction_id_product_id'),
+    ('cart item lookup',
+     select(TransactionItems).where(TransactionItems.transaction_id == 1, TransactionItems.product_id == 1),
+     'ix_transaction_items_transaction_id_product_id'),
+    ('promotions of a product',
+     select(Promotion).where(Promotion.product_id == 1),
+     'ix_promotions_product_id'),
+    ('active products of a category',
+     listing_page(select(Product).where(Product.category_id == 1, Product.is_active == 1), Product),
+     'ix_products_category_id_is_active'),
+    ('products/category/<id>',
+     listing_page(select(Product).where(Product.category_id == 1), Product),
+     'ix_products_category_id_is_active'),
+    ('products/agen/<id>',
+     listing_page(select(Product).where(Product.user_id == 1), Product),
+     'ix_products_user_id'),
+    ('login and register',
+     select(User).where(User.email == 'user@example.com', User.role == 'konsumen'),
+     'ix_users_email_role'),
+)
+
+
+def check_hot_queries(engine=None):
+    """
+    Run EXPLAIN QUERY PLAN for every hot query on a freshly migrated SQLite database.
+    :return: List of (route, index_name, plan, uses_index).
+    """
+    engine = engine or create_engine('sqlite://')
+    upgrade(engine)
+
+    results = []
+    with engine.connect() as connection:
+        for name, statement, index_name in HOT_QUERIES:
+            sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+            plan = '; '.join(row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+            results.append((name, index_name, plan, f'INDEX {index_name}' in plan))
+    return results
@@ -0,0 +1,138 @@
+"""Initial schema: create the tables db.create_all() used to create on startup."""
+from sqlalchemy import (
+    Boolean, Column, DateTime, Enum, Float, ForeignKey, Integer, MetaData, Numeric, String, Table, Text,
+)
+
+revision = '0001'
+
+# The schema as it was when migrations were introduced, frozen here so this revision
+# never changes with the models; later schema changes are new revisions
+metadata = MetaData()
+
+Table(
+    'agens', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('location', String(255), nullable=False),
+    Column('is_open', Boolean),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'categories', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('category_name', String(255), nullable=False, unique=True),
+    Column('description', Text),
+    Column('image_url', String(500)),
+)
+
+Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(255), nullable=False),
+    Column('fullname', String(255), nullable=False),
+    Column('email', String(255), nullable=False),
+    Column('description', Text),
+    Column('password_hash', String(255), nullable=False),
+    Column('pin_hash', String(255), nullable=False),
+    Column('balance', Numeric(10, 2)),
+    Column('phone_number', String(100), nullable=False),
+    Column('agen_id', Integer),
+    Column('location', String(255)),
+    Column('role', Enum('konsumen', 'pedagang', 'agen', 'driver', 'admin'), nullable=False),
+    Column('image_url', String(500)),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'products', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('category_id', Integer, ForeignKey('categories.id'), nullable=False),
+    Column('product_name', String(255), nullable=False),
+    Column('description', Text),
+    Column('price', Float, nullable=False),
+    Column('stock', Integer, nullable=False),
+    Column('image_url', String(500)),
+    Column('ordered_times', Integer),
+    Column('rated_times', Integer),
+    Column('sum_rated', Integer),
+    Column('is_active', Integer, nullable=False),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'transactions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('from_user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('to_user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('driver_id', Integer, ForeignKey('users.id')),
+    Column('shipping_cost', Float),
+    Column('total_amount', Float, nullable=False),
+    Column('type', Enum('withdrawal', 'transfer', 'deposit')),
+    Column('status', Enum('cart', 'ordered', 'processed', 'taken', 'completed', 'completed(reviewed)'), nullable=False),
+    Column('description', String(255)),
+    Column('user_location', String(255)),
+    Column('driver_location', String(255)),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'deliveries', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('transaction_id', Integer, ForeignKey('transactions.id'), nullable=False),
+    Column('driver_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('status', Enum('pending', 'in_progress', 'delivered', 'failed'), nullable=False),
+    Column('pickup_location', String(255), nullable=False),
+    Column('delivery_location', String(255), nullable=False),
+    Column('estimated_time', DateTime),
+    Column('delivered_at', DateTime),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'product_reviews', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('review_text', Text),
+    Column('star_rating', Integer),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'promotions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, ForeignKey('products.id')),
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('transaction_id', Integer, ForeignKey('transactions.id')),
+    Column('scheme', Enum('discount', 'cashback', 'nominal')),
+    Column('scheme_percentage', Float),
+    Column('description', Text),
+    Column('start_date', DateTime),
+    Column('end_date', DateTime),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'transaction_items', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('transaction_id', Integer, ForeignKey('transactions.id'), nullable=False),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('subtotal', Float, nullable=False),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+
+def upgrade(connection):
+    # Existing databases already have these tables; checkfirst leaves them alone
+    metadata.create_all(bind=connection, checkfirst=True)
@@ -0,0 +1,20 @@
+"""Composite indexes for the hot listing and lookup filters."""
+from migrations import create_index
+
+revision = '0002'
+
+INDEXES = (
+    ('transactions', 'ix_transactions_to_user_id_status', ('to_user_id', 'status')),
+    ('transactions', 'ix_transactions_from_user_id_status', ('from_user_id', 'status')),
+    ('transactions', 'ix_transactions_driver_id_status', ('driver_id', 'status')),
+    ('transaction_items', 'ix_transaction_items_transaction_id_product_id', ('transaction_id', 'product_id')),
+    ('promotions', 'ix_promotions_product_id', ('product_id',)),
+    ('products', 'ix_products_category_id_is_active', ('category_id', 'is_active')),
+    ('products', 'ix_products_user_id', ('user_id',)),
+    ('users', 'ix_users_email_role', ('email', 'role')),
+)
+
+
+def upgrade(connection):
+    for table_name, index_name, columns in INDEXES:
+        create_index(connection, table_name, index_name, columns)
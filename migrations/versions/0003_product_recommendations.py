@@ -0,0 +1,22 @@
+"""Table of precomputed "frequently bought together" neighbours per product."""
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, Table
+
+revision = '0003'
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    # Reflected so the foreign keys below resolve
+    Table('products', metadata, autoload_with=connection)
+    product_recommendations = Table(
+        'product_recommendations', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+        Column('recommended_product_id', Integer, ForeignKey('products.id'), nullable=False),
+        Column('rank', Integer, nullable=False),
+        Column('co_purchases', Integer, nullable=False),
+        Column('score', Float, nullable=False),
+        Column('created_at', DateTime),
+        Index('ix_product_recommendations_product_id_rank', 'product_id', 'rank'),
+    )
+    product_recommendations.create(bind=connection, checkfirst=True)
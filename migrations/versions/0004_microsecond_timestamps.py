@@ -0,0 +1,20 @@
+"""Microsecond created_at/updated_at on the tables behind catalog ETags."""
+from sqlalchemy import inspect, text
+
+revision = '0004'
+
+TABLES = ('users', 'products', 'product_reviews', 'promotions')
+
+
+def upgrade(connection):
+    # Other databases already keep microseconds in their datetime columns
+    if connection.dialect.name != 'mysql':
+        return
+    for table_name in TABLES:
+        columns = {column['name']: column for column in inspect(connection).get_columns(table_name)}
+        changes = [
+            f"MODIFY `{name}` DATETIME(6) NULL" for name in ('created_at', 'updated_at')
+            if name in columns and getattr(columns[name]['type'], 'fsp', None) != 6
+        ]
+        if changes:
+            connection.execute(text(f"ALTER TABLE `{table_name}` {', '.join(changes)}"))
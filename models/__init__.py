@@ -1,3 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import mysql
 
 db = SQLAlchemy()
+
+# DATETIME keeps whole seconds on MySQL; conditional GETs compare max(updated_at), which
+# must also change for writes within the same second
+PreciseDateTime = db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
@@ -0,0 +1,49 @@
+from sqlalchemy.orm import load_only
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def is_integer(value):
+    """True for ints from a JSON body; true/false arrive as bools, which Python also counts as ints."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_id(value):
+    """A positive id from a JSON body, given as an int or a string of digits; None for anything else."""
+    if isinstance(value, str) and value.strip().isdecimal():
+        value = int(value)
+    return value if is_integer(value) and value > 0 else None
+
+
+def parse_fields(value, allowed):
+    """
+    Parse a `fields=a,b,c` query parameter.
+    :param allowed: Field names the endpoint can return.
+    :return: List of requested fields in request order, or None when all fields are wanted.
+    """
+    if not value:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return fields or None
+
+
+def select_columns(model, fields, column_map, always=('id', 'created_at')):
+    """
+    Loader option restricting a query on `model` to the columns behind the requested fields.
+    :param column_map: {field: tuple of column names it reads}
+    :param always: Columns every listing needs, e.g. for keyset pagination.
+    """
+    columns = set(always)
+    for field in fields:
+        columns.update(column_map.get(field, ()))
+    return load_only(*[getattr(model, column) for column in sorted(columns)])
+
+
+def sparse_dict(instance, fields):
+    """Serialize only the given attributes of a model instance; the app's JSON provider encodes the values."""
+    return {field: getattr(instance, field) for field in fields}
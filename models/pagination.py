@@ -0,0 +1,88 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row):
+    """Encode the (created_at, id) position of a row into an opaque cursor string."""
+    payload = json.dumps([row.created_at.isoformat() if row.created_at else None, row.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor string back into (created_at, id)."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_paginate(query, model, limit=None, after=None, descending=False):
+    """
+    Paginate a query on (created_at, id) without OFFSET, so every page costs the same.
+    :param query: Query over `model`, already filtered.
+    :param model: Model class with `created_at` and `id` columns.
+    :param limit: Page size, capped at MAX_PAGE_LIMIT.
+    :param after: Cursor returned as `next_cursor` by the previous page.
+    :param descending: Newest first instead of oldest first.
+    :return: (rows, next_cursor); next_cursor is None on the last page.
+    """
+    limit = min(max(int(limit or DEFAULT_PAGE_LIMIT), 1), MAX_PAGE_LIMIT)
+
+    if after:
+        created_at, row_id = decode_cursor(after)
+        if descending:
+            # NULL timestamps sort last when descending
+            if created_at is None:
+                query = query.filter(model.created_at.is_(None), model.id < row_id)
+            else:
+                query = query.filter(or_(
+                    model.created_at < created_at,
+                    and_(model.created_at == created_at, model.id < row_id),
+                    model.created_at.is_(None),
+                ))
+        elif created_at is None:
+            # NULL timestamps sort first, so everything non-NULL comes after them
+            query = query.filter(or_(
+                and_(model.created_at.is_(None), model.id > row_id),
+                model.created_at.isnot(None),
+            ))
+        else:
+            query = query.filter(or_(
+                model.created_at > created_at,
+                and_(model.created_at == created_at, model.id > row_id),
+            ))
+
+    if descending:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.created_at, model.id)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
+
+
+def fetch_page(query, model, args):
+    """
+    Run a listing query, paginated when the request passes `limit` or `after`.
+    Without either parameter the full result is returned, as listings did before.
+    :param args: The request's query parameters (request.args).
+    :return: (rows, next_cursor)
+    """
+    if 'limit' not in args and 'after' not in args:
+        return query.all(), None
+    return keyset_paginate(query, model, args.get('limit', type=int), args.get('after'))
@@ -1,9 +1,14 @@
 from datetime import datetime
-from . import db
+from . import db, PreciseDateTime
 from models.users import User
+from .fields import sparse_dict
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_category_id_is_active', 'category_id', 'is_active'),
+        db.Index('ix_products_user_id', 'user_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -17,24 +22,56 @@ class Product(db.Model):
     rated_times = db.Column(db.Integer, nullable=True, default=0)
     sum_rated = db.Column(db.Integer, nullable=True, default=0)  
     is_active = db.Column(db.Integer, nullable=False, default=1)  
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)  
-    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow) 
+    created_at = db.Column(PreciseDateTime, default=datetime.utcnow)  
+    updated_at = db.Column(PreciseDateTime, onupdate=datetime.utcnow) 
     
     reviews = db.relationship('ProductReview', backref='product', lazy=True)  # Relasi ke ulasan
+
+    @property
+    def average_rating(self):
+        """Average star rating from the maintained rated_times/sum_rated aggregates."""
+        return (self.sum_rated or 0) / self.rated_times if self.rated_times else 0
+
+    def add_rating(self, star_rating):
+        """Count a new star rating in the aggregates, incremented in SQL so concurrent reviews are not lost."""
+        Product.query.filter_by(id=self.id).update({
+            Product.rated_times: db.func.coalesce(Product.rated_times, 0) + 1,
+            Product.sum_rated: db.func.coalesce(Product.sum_rated, 0) + star_rating,
+        }, synchronize_session=False)
     
-    def to_dict(self):
-        """Convert the Product instance into a dictionary."""
+    # Fields a listing can select with ?fields=, and the columns each one reads
+    SPARSE_FIELDS = {
+        "id": ("id",),
+        "user_id": ("user_id",),
+        "product_name": ("product_name",),
+        "description": ("description",),
+        "price": ("price",),
+        "stock": ("stock",),
+        "category_id": ("category_id",),
+        "image_url": ("image_url",),
+        "is_active": ("is_active",),
+        "rated_times": ("rated_times",),
+        "average_rating": ("rated_times", "sum_rated"),
+        "created_at": ("created_at",),
+    }
+
+    def to_dict(self, fields=None):
+        """Convert the Product instance into a dictionary, optionally limited to the given fields."""
+        if fields is not None:
+            return sparse_dict(self, fields)
         return {
             "id": self.id,
             "user_id": self.user_id,
             "product_name": self.product_name,
             "description": self.description,
-            "price": float(self.price),  # Ensure floats are JSON serializable
+            "price": self.price,
             "stock": self.stock,
             "category_id": self.category_id,
             "image_url": self.image_url,
             "is_active": self.is_active,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "rated_times": self.rated_times or 0,
+            "average_rating": self.average_rating,
+            "created_at": self.created_at,
         }
         
 class ProductReview(db.Model):
@@ -45,8 +82,8 @@ class ProductReview(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # Relasi ke pengguna
     review_text = db.Column(db.Text, nullable=True)  # Teks ulasan
     star_rating = db.Column(db.Integer, nullable=True)  # Penilaian bintang (1-5)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Waktu ulasan dibuat
-    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)  # Waktu ulasan diubah
+    created_at = db.Column(PreciseDateTime, default=datetime.utcnow)  # Waktu ulasan dibuat
+    updated_at = db.Column(PreciseDateTime, onupdate=datetime.utcnow)  # Waktu ulasan diubah
 
     def to_dict(self):
         """Convert the ProductReview instance into a dictionary."""
@@ -56,8 +93,8 @@ class ProductReview(db.Model):
             "user_id": self.user_id,
             "review_text": self.review_text,
             "star_rating": self.star_rating,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
         }
 
 
@@ -74,6 +111,9 @@ class Category(db.Model):
     
 class Promotion(db.Model):
     __tablename__ = 'promotions'
+    __table_args__ = (
+        db.Index('ix_promotions_product_id', 'product_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=True)
@@ -84,8 +124,8 @@ class Promotion(db.Model):
     description = db.Column(db.Text, nullable=True)
     start_date = db.Column(db.DateTime, nullable=True)
     end_date = db.Column(db.DateTime, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    created_at = db.Column(PreciseDateTime, default=datetime.utcnow)
+    updated_at = db.Column(PreciseDateTime, onupdate=datetime.utcnow)
     
     def to_dict(self):
         return {
@@ -96,8 +136,22 @@ class Promotion(db.Model):
             "scheme": self.scheme,
             "scheme_percentage": self.scheme_percentage,
             "description": self.description,
-            "start_date": self.start_date.isoformat() if self.start_date else None,
-            "end_date": self.end_date.isoformat() if self.end_date else None,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-        }
\ No newline at end of file
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+class ProductRecommendation(db.Model):
+    __tablename__ = 'product_recommendations'
+    __table_args__ = (
+        db.Index('ix_product_recommendations_product_id_rank', 'product_id', 'rank'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    recommended_product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)  # 1 = most often bought together
+    co_purchases = db.Column(db.Integer, nullable=False)  # Completed transactions containing both products
+    score = db.Column(db.Float, nullable=False)  # co_purchases / sqrt(purchases of each product)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,3 +1,3 @@
-from .transaction import Transaction
+from .transaction import Transaction, COMPLETED_STATUSES, COMPLETABLE_STATUSES
 from .transaction_items import TransactionItems
 from .delivery import Delivery
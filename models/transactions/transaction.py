@@ -2,9 +2,20 @@ from .. import db
 from datetime import datetime
 from models.users import User
 from models.products import Product
+from .transaction_items import TransactionItems
+
+# Statuses of transactions whose items count as sold
+COMPLETED_STATUSES = ("completed", "completed(reviewed)")
+# Statuses a transaction can be completed (and its market and driver paid) from
+COMPLETABLE_STATUSES = ("ordered", "processed", "taken")
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_to_user_id_status', 'to_user_id', 'status'),
+        db.Index('ix_transactions_from_user_id_status', 'from_user_id', 'status'),
+        db.Index('ix_transactions_driver_id_status', 'driver_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     from_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -23,18 +34,55 @@ class Transaction(db.Model):
     transaction_items = db.relationship('TransactionItems', backref='transaction', lazy=True)
     delivery = db.relationship('Delivery', backref='transaction', lazy=True)
     
+    # Fields a listing can select with ?fields=, and the columns each one reads
+    SPARSE_FIELDS = {
+        **{field: (field,) for field in (
+            "id", "from_user_id", "to_user_id", "total_amount", "driver_id", "type", "shipping_cost",
+            "status", "description", "user_location", "driver_location", "created_at", "updated_at",
+        )},
+        "market_name": ("to_user_id",),
+        "items": (),
+    }
+
     def to_dict(self):
         """Convert the Transaction instance into a dictionary."""
-        # Fetch market/agent name
-        market = User.query.filter_by(id=self.to_user_id, role="agen").first()
-        market_name = market.fullname if market else "Unknown Market"
+        return Transaction.bulk_to_dict([self])[0]
+
+    @staticmethod
+    def bulk_to_dict(transactions, fields=None):
+        """
+        Serialize a list of transactions with the same shape as to_dict(),
+        loading markets, items and products in one query each.
+        With `fields`, only those keys are returned and unrequested lookups are skipped.
+        """
+        if not transactions:
+            return []
+
+        transaction_ids = [transaction.id for transaction in transactions]
+        market_names = {}
+        items_by_transaction = {transaction_id: [] for transaction_id in transaction_ids}
 
-        # Fetch product details for each item
-        items = []
-        for item in self.transaction_items:
-            product = Product.query.get(item.product_id)
+        # Fetch market/agent names
+        if fields is None or "market_name" in fields:
+            market_ids = {transaction.to_user_id for transaction in transactions}
+            markets = User.query.filter(User.id.in_(market_ids), User.role == "agen").all()
+            market_names = {market.id: market.fullname for market in markets}
+
+        # Fetch items and their products
+        transaction_items = []
+        products_by_id = {}
+        if fields is None or "items" in fields:
+            transaction_items = TransactionItems.query.filter(
+                TransactionItems.transaction_id.in_(transaction_ids)
+            ).order_by(TransactionItems.id).all()
+            product_ids = {item.product_id for item in transaction_items}
+            products = Product.query.filter(Product.id.in_(product_ids)).all() if product_ids else []
+            products_by_id = {product.id: product for product in products}
+
+        for item in transaction_items:
+            product = products_by_id.get(item.product_id)
             if product:
-                items.append({
+                items_by_transaction[item.transaction_id].append({
                     "id": item.id,
                     "product_id": item.product_id,
                     "product_name": product.product_name,
@@ -45,20 +93,37 @@ class Transaction(db.Model):
                     "subtotal": item.subtotal,
                 })
 
-        return {
-            "id": self.id,
-            "from_user_id": self.from_user_id,
-            "to_user_id": self.to_user_id,
-            "market_name": market_name,
-            "total_amount": self.total_amount,
-            "driver_id": self.driver_id,
-            "type": self.type,
-            "shipping_cost": self.shipping_cost,
-            "status": self.status,
-            "description": self.description,
-            "user_location": self.user_location,
-            "driver_location": self.driver_location,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-            "items": items,
-        }
+        if fields is not None:
+            results = []
+            for transaction in transactions:
+                transaction_data = {}
+                for field in fields:
+                    if field == "market_name":
+                        transaction_data[field] = market_names.get(transaction.to_user_id, "Unknown Market")
+                    elif field == "items":
+                        transaction_data[field] = items_by_transaction[transaction.id]
+                    else:
+                        transaction_data[field] = getattr(transaction, field)
+                results.append(transaction_data)
+            return results
+
+        return [
+            {
+                "id": transaction.id,
+                "from_user_id": transaction.from_user_id,
+                "to_user_id": transaction.to_user_id,
+                "market_name": market_names.get(transaction.to_user_id, "Unknown Market"),
+                "total_amount": transaction.total_amount,
+                "driver_id": transaction.driver_id,
+                "type": transaction.type,
+                "shipping_cost": transaction.shipping_cost,
+                "status": transaction.status,
+                "description": transaction.description,
+                "user_location": transaction.user_location,
+                "driver_location": transaction.driver_location,
+                "created_at": transaction.created_at,
+                "updated_at": transaction.updated_at,
+                "items": items_by_transaction[transaction.id],
+            }
+            for transaction in transactions
+        ]
@@ -6,6 +6,9 @@ from sqlalchemy.orm import relationship
 
 class TransactionItems(db.Model):
     __tablename__ = 'transaction_items'
+    __table_args__ = (
+        db.Index('ix_transaction_items_transaction_id_product_id', 'transaction_id', 'product_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False)
@@ -25,6 +28,6 @@ class TransactionItems(db.Model):
             "product_id": self.product_id,
             "quantity": self.quantity,
             "subtotal": self.subtotal,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
         }
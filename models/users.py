@@ -1,10 +1,14 @@
-from . import db
+from . import db, PreciseDateTime
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from decimal import Decimal
+from .fields import sparse_dict
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_email_role', 'email', 'role'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(255), unique=False, nullable=False)
@@ -19,25 +23,35 @@ class User(db.Model):
     location = db.Column(db.String(255), nullable=True)
     role = db.Column(db.Enum('konsumen', 'pedagang', 'agen', 'driver', 'admin'), nullable=False)
     image_url = db.Column(db.String(500), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    created_at = db.Column(PreciseDateTime, default=datetime.utcnow)
+    updated_at = db.Column(PreciseDateTime, onupdate=datetime.utcnow)
     
-    def to_dict(self):
-        """Return a dictionary representation of the User."""
+    # Public fields a listing can select with ?fields=; each reads the column of the same name
+    SPARSE_FIELDS = {
+        field: (field,) for field in (
+            "id", "username", "fullname", "email", "description", "balance", "phone_number",
+            "agen_id", "location", "role", "image_url", "created_at", "updated_at",
+        )
+    }
+
+    def to_dict(self, fields=None):
+        """Return a dictionary representation of the User, optionally limited to the given fields."""
+        if fields is not None:
+            return sparse_dict(self, fields)
         return {
             "id": self.id,
             "username": self.username,
             "fullname": self.fullname,
             "email": self.email,
             "description": self.description,
-            "balance": float(self.balance),  # Convert Decimal to float for JSON serialization
+            "balance": self.balance,
             "phone_number": self.phone_number,
             "agen_id": self.agen_id,
             "location": self.location,
             "role": self.role,
             "image_url": self.image_url,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
         }
 
     def set_password(self, password):
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration on import: point it at a throwaway SQLite file
+# (a file, not :memory:, so threads share it) and keep background work off
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db?timeout=30"
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret-key-test-jwt-secret-key")
+os.environ["AUTO_MIGRATE"] = "0"
+os.environ["CART_SWEEP_INTERVAL_SECONDS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from sqlalchemy import event, text  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+from app import app as flask_app  # noqa: E402
+from models import db  # noqa: E402
+from models.users import User  # noqa: E402
+from models.products import Product, Category  # noqa: E402
+from models.transactions import Transaction, TransactionItems  # noqa: E402
+
+PIN = "1234"
+
+
+@event.listens_for(Engine, "connect")
+def enforce_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys unless asked to; MySQL always enforces them
+    dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        with db.engine.connect() as connection:
+            connection.execute(text("PRAGMA journal_mode=WAL"))
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def market(app):
+    """A market (agen) with two products of 10 units each, and a consumer with a balance."""
+    agent = User(username="market", fullname="Market", email="market@example.com", password_hash="x",
+                 pin_hash="x", phone_number="0", role="agen",
+                 location=json.dumps({"lat": -7.80, "lng": 110.37}))
+    consumer = User(username="buyer", fullname="Buyer", email="buyer@example.com", password_hash="x",
+                    pin_hash="x", phone_number="1", role="konsumen", balance=100000)
+    consumer.set_pin(PIN)
+    category = Category(category_name="Sayur")
+    db.session.add_all([agent, consumer, category])
+    db.session.flush()
+    products = [
+        Product(user_id=agent.id, category_id=category.id, product_name=name, price=price, stock=10)
+        for name, price in (("Bayam", 1000), ("Kangkung", 2000))
+    ]
+    db.session.add_all(products)
+    db.session.commit()
+    return {"agent": agent.id, "consumer": consumer.id, "products": [product.id for product in products]}
+
+
+@pytest.fixture
+def cart(market):
+    """A cart of 2 x product 0 and 1 x product 1 with its delivery location set, stock already taken."""
+    first, second = market["products"]
+    transaction = Transaction(from_user_id=market["consumer"], to_user_id=market["agent"], status="cart",
+                              type="transfer", total_amount=4000, shipping_cost=5000,
+                              user_location=json.dumps({"lat": -7.81, "lng": 110.37}))
+    db.session.add(transaction)
+    db.session.flush()
+    db.session.add_all([
+        TransactionItems(transaction_id=transaction.id, product_id=first, quantity=2, subtotal=2000),
+        TransactionItems(transaction_id=transaction.id, product_id=second, quantity=1, subtotal=2000),
+    ])
+    Product.query.filter(Product.id == first).update({Product.stock: 8})
+    Product.query.filter(Product.id == second).update({Product.stock: 9})
+    db.session.commit()
+    return transaction.id
+
+
+@pytest.fixture
+def auth_header(app):
+    def header(user_id):
+        return {"Authorization": "Bearer " + create_access_token(identity=str(user_id))}
+    return header
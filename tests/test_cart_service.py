@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+from models.products import Product
+from models.transactions import Transaction, TransactionItems
+from connectors.cart.cart_service import CartError, add_items, set_item_quantity
+
+
+def test_add_items_reserves_stock_and_totals_the_cart(market):
+    first, second = market["products"]
+
+    [transaction] = add_items(market["consumer"], {first: 2, second: 1})
+
+    assert transaction["total_amount"] == 4000
+    assert db.session.get(Product, first).stock == 8
+    assert db.session.get(Transaction, transaction["id"]).total_amount == 4000
+
+
+def test_add_items_is_all_or_nothing(market):
+    first, second = market["products"]
+
+    with pytest.raises(CartError) as error:
+        add_items(market["consumer"], {first: 2, second: 11})
+
+    assert error.value.status == 400
+    assert [db.session.get(Product, product_id).stock for product_id in (first, second)] == [10, 10]
+    assert TransactionItems.query.count() == 0
+
+
+def test_concurrent_adds_never_oversell(app, market):
+    product_id = market["products"][0]
+    statuses = []
+    statuses_lock = threading.Lock()
+
+    def buy():
+        client = app.test_client()
+        for _ in range(5):
+            status = client.post(f"/cart/add/{market['consumer']}",
+                                 json={"product_id": product_id, "quantity": 1}).status_code
+            with statuses_lock:
+                statuses.append(status)
+
+    threads = [threading.Thread(target=buy) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db.session.expire_all()
+    in_carts = db.session.query(db.func.sum(TransactionItems.quantity)) \
+        .filter(TransactionItems.product_id == product_id).scalar()
+    assert statuses.count(201) == 10
+    assert statuses.count(400) == 20
+    assert in_carts == 10
+    assert db.session.get(Product, product_id).stock == 0
+
+
+@pytest.mark.parametrize("body", [
+    {"product_id": 1, "quantity": -3},
+    {"product_id": 1, "quantity": True},
+    {"product_id": [1], "quantity": 1},
+])
+def test_add_to_cart_rejects_invalid_items(client, market, body):
+    response = client.post(f"/cart/add/{market['consumer']}", json=body)
+
+    assert response.status_code == 400
+    assert db.session.get(Product, market["products"][0]).stock == 10
+
+
+def test_add_to_cart_accepts_numeric_strings(client, market):
+    response = client.post(f"/cart/add/{market['consumer']}",
+                           json={"product_id": str(market["products"][0]), "quantity": "2"})
+
+    assert response.status_code == 201
+    assert db.session.get(Product, market["products"][0]).stock == 8
+
+
+def test_set_item_quantity_moves_the_stock_difference(cart, market):
+    item = TransactionItems.query.filter_by(transaction_id=cart, product_id=market["products"][0]).one()
+
+    summary = set_item_quantity(item.id, 5)
+
+    assert summary["product"]["stock"] == 5
+    assert summary["transaction"]["total_amount"] == 7000
+    db.session.expire_all()
+    assert db.session.get(Product, market["products"][0]).stock == 5
+    assert db.session.get(Transaction, cart).total_amount == 7000
+
+
+def test_set_item_quantity_conflicts_with_a_concurrent_change(app, cart, market):
+    item = TransactionItems.query.filter_by(transaction_id=cart, product_id=market["products"][0]).one()
+    item_id = item.id
+    db.session.commit()
+
+    # Another request changes the item right after this one has read it
+    fired = []
+
+    def change_item(connection, cursor, statement, *args):
+        if statement.startswith("SELECT transaction_items."):
+            if fired:
+                return
+            fired.append(statement)
+            cursor.connection.execute("UPDATE transaction_items SET quantity = 3 WHERE id = ?", (item_id,))
+
+    event.listen(db.engine, "after_cursor_execute", change_item)
+    try:
+        with pytest.raises(CartError) as error:
+            set_item_quantity(item_id, 5)
+    finally:
+        event.remove(db.engine, "after_cursor_execute", change_item)
+
+    assert error.value.status == 409
+    db.session.expire_all()
+    assert db.session.get(Product, market["products"][0]).stock == 8
+
+
+def test_set_item_quantity_beyond_stock(cart, market):
+    item = TransactionItems.query.filter_by(transaction_id=cart, product_id=market["products"][0]).one()
+
+    with pytest.raises(CartError) as error:
+        set_item_quantity(item.id, 11)
+
+    assert error.value.status == 400
+    assert error.value.details == {"available_stock": 8}
+    db.session.expire_all()
+    assert db.session.get(TransactionItems, item.id).quantity == 2
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from models import db
+from models.products import Product, Promotion
+from models.transactions import Transaction, TransactionItems
+from connectors.cart.cart_service import add_items
+from connectors.cart.cart_sweeper import sweep_expired_carts
+
+
+def expire(transaction_ids):
+    Transaction.query.filter(Transaction.id.in_(transaction_ids)) \
+        .update({Transaction.updated_at: datetime.utcnow() - timedelta(days=2)}, synchronize_session=False)
+    db.session.commit()
+
+
+def test_sweep_deletes_expired_carts_and_restocks(cart, market):
+    expire([cart])
+
+    totals = sweep_expired_carts(ttl_seconds=60)
+
+    assert totals == {"carts": 1, "items": 2, "products": 2, "units": 3}
+    assert db.session.get(Transaction, cart) is None
+    assert [db.session.get(Product, product_id).stock for product_id in market["products"]] == [10, 10]
+
+
+def test_sweep_keeps_fresh_carts(cart):
+    assert sweep_expired_carts(ttl_seconds=60)["carts"] == 0
+    assert db.session.get(Transaction, cart) is not None
+
+
+def test_sweep_skips_carts_a_promotion_refers_to(cart, market):
+    # Another user's cart in the same batch must still be swept
+    [other] = add_items(market["agent"], {market["products"][1]: 1})
+    db.session.add(Promotion(product_id=market["products"][0], user_id=market["agent"], transaction_id=cart,
+                             scheme="cashback", scheme_percentage=5))
+    db.session.commit()
+    expire([cart, other["id"]])
+
+    totals = sweep_expired_carts(ttl_seconds=60, batch_size=10)
+
+    assert totals["carts"] == 1
+    assert db.session.get(Transaction, other["id"]) is None
+    assert db.session.get(Transaction, cart) is not None
+    assert TransactionItems.query.filter_by(transaction_id=cart).count() == 2
+    assert [db.session.get(Product, product_id).stock for product_id in market["products"]] == [8, 9]
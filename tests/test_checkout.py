@@ -0,0 +1,108 @@
+import pytest
+from sqlalchemy import event
+
+from models import db
+from models.users import User
+from models.products import Promotion
+from models.transactions import Transaction, TransactionItems
+from connectors.cart.cart_service import CartError, checkout
+from .conftest import PIN
+
+
+def test_checkout_orders_the_cart_and_debits_the_balance(client, cart, market, auth_header):
+    response = client.post("/cart/checkout", json={"pin_hash": PIN}, headers=auth_header(market["consumer"]))
+
+    assert response.status_code == 200
+    assert response.get_json()["balance"] == 100000 - 4000 - 5000
+    db.session.expire_all()
+    assert db.session.get(Transaction, cart).status == "ordered"
+    assert float(db.session.get(User, market["consumer"]).balance) == 91000
+
+
+def test_checkout_applies_discounts(cart, market):
+    db.session.add(Promotion(product_id=market["products"][0], user_id=market["agent"],
+                             scheme="discount", scheme_percentage=50))
+    db.session.commit()
+
+    summary = checkout(market["consumer"], PIN)
+
+    assert summary["total_amount"] == 3000
+    db.session.expire_all()
+    item = TransactionItems.query.filter_by(transaction_id=cart, product_id=market["products"][0]).one()
+    assert item.subtotal == 1000
+    assert db.session.get(Transaction, cart).total_amount == 3000
+
+
+def test_checkout_rejects_a_wrong_pin(cart, market):
+    with pytest.raises(CartError) as error:
+        checkout(market["consumer"], "0000")
+
+    assert error.value.status == 401
+
+
+@pytest.mark.parametrize("column", ["shipping_cost", "user_location"])
+def test_checkout_needs_a_delivery_location(cart, market, column):
+    Transaction.query.filter_by(id=cart).update({column: None})
+    db.session.commit()
+
+    with pytest.raises(CartError) as error:
+        checkout(market["consumer"], PIN)
+
+    assert error.value.status == 400
+    assert error.value.details == {"transaction_ids": [cart]}
+
+
+def test_checkout_rejects_a_non_positive_line(cart, market):
+    TransactionItems.query.filter_by(transaction_id=cart, product_id=market["products"][0]) \
+        .update({TransactionItems.quantity: -5, TransactionItems.subtotal: -5000})
+    db.session.commit()
+
+    with pytest.raises(CartError) as error:
+        checkout(market["consumer"], PIN)
+
+    assert error.value.status == 400
+    db.session.expire_all()
+    assert db.session.get(Transaction, cart).status == "cart"
+
+
+def test_checkout_with_insufficient_balance_changes_nothing(cart, market):
+    User.query.filter_by(id=market["consumer"]).update({User.balance: 8999})
+    db.session.commit()
+
+    with pytest.raises(CartError) as error:
+        checkout(market["consumer"], PIN)
+
+    assert error.value.status == 403
+    db.session.expire_all()
+    assert db.session.get(Transaction, cart).status == "cart"
+    assert float(db.session.get(User, market["consumer"]).balance) == 8999
+
+
+def test_checkout_conflicts_with_a_concurrent_checkout(cart, market):
+    # Another checkout orders the cart right after this one has read it
+    fired = []
+
+    def order_cart(connection, cursor, statement, *args):
+        if statement.startswith("SELECT transaction_items."):
+            if fired:
+                return
+            fired.append(statement)
+            cursor.connection.execute("UPDATE transactions SET status = 'ordered' WHERE id = ?", (cart,))
+
+    event.listen(db.engine, "after_cursor_execute", order_cart)
+    try:
+        with pytest.raises(CartError) as error:
+            checkout(market["consumer"], PIN)
+    finally:
+        event.remove(db.engine, "after_cursor_execute", order_cart)
+
+    assert error.value.status == 409
+    db.session.expire_all()
+    assert float(db.session.get(User, market["consumer"]).balance) == 100000
+
+
+def test_checkout_without_a_cart(market):
+    with pytest.raises(CartError) as error:
+        checkout(market["consumer"], PIN)
+
+    assert error.value.status == 404
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from models import db
+from models.products import Product
+
+
+def test_product_etag_is_strong_and_answers_304(client, market):
+    url = f"/products/product/{market['products'][0]}"
+    response = client.get(url)
+
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert client.get(url, headers={"If-None-Match": f'"{etag}"'}).status_code == 304
+
+
+def test_product_etag_follows_writes_from_other_processes(client, market):
+    url = f"/products/product/{market['products'][0]}"
+    before = client.get(url).get_etag()[0]
+
+    # Written by another worker process: nothing in this one is told, and the edit
+    # lands in the same second as the previous one
+    updated_at = datetime.utcnow()
+    Product.query.filter_by(id=market["products"][0]).update({Product.price: 1500, Product.updated_at: updated_at})
+    db.session.commit()
+    first = client.get(url)
+    Product.query.filter_by(id=market["products"][0]) \
+        .update({Product.price: 1600, Product.updated_at: updated_at.replace(microsecond=updated_at.microsecond ^ 1)})
+    db.session.commit()
+    second = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.get_etag()[0] != before
+    assert second.status_code == 200
+    assert second.get_etag()[0] != first.get_etag()[0]
@@ -0,0 +1,59 @@
+import csv
+import io
+
+import pytest
+
+from models import db
+from models.products import Category, Product
+
+
+@pytest.fixture
+def upload(client, market, auth_header):
+    def post(body, file_format):
+        return client.post(f"/products/import_products?format={file_format}", data=io.BytesIO(body),
+                           headers=auth_header(market["agent"]), content_type="application/octet-stream")
+    return post
+
+
+@pytest.fixture
+def category_id(market):
+    return db.session.query(Category.id).scalar()
+
+
+def test_import_reports_invalid_rows_and_keeps_valid_ones(upload, category_id):
+    rows = [
+        f'{{"product_name": "Tomat", "price": 1500, "stock": 4, "category_id": {category_id}}}',
+        f'{{"product_name": "NaN price", "price": NaN, "stock": 4, "category_id": {category_id}}}',
+        f'{{"product_name": "Inf price", "price": "inf", "stock": 4, "category_id": {category_id}}}',
+        f'{{"product_name": "Odd flag", "price": 10, "stock": 4, "category_id": {category_id}, "is_active": 7}}',
+    ]
+    body = "\n".join(rows).encode() + b'\n{"product_name": "\xff"}\n'
+
+    response = upload(body, "jsonl")
+
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result["imported"] == 1
+    assert [error["row"] for error in result["errors"]] == [2, 3, 4, 5]
+    assert Product.query.filter_by(product_name="Tomat").count() == 1
+
+
+def test_import_reports_malformed_csv_rows(upload, category_id):
+    body = (f'product_name,price,stock,category_id\n'
+            f'Tomat,1500,4,{category_id}\n'
+            f'Huge,1500,4,{category_id},{"x" * (csv.field_size_limit() + 1)}\n'
+            f'Cabai,2500,2,{category_id}\n').encode()
+
+    response = upload(body, "csv")
+
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result["imported"] == 2
+    assert [error["row"] for error in result["errors"]] == [2]
+
+
+def test_import_rejects_a_csv_that_is_not_utf8(upload, category_id):
+    response = upload(f'product_name,price,stock,category_id\nCaf\xe9,1500,4,{category_id}\n'.encode('latin-1'), "csv")
+
+    assert response.status_code == 400
+    assert Product.query.count() == 2
@@ -0,0 +1,70 @@
+import json
+
+from models import db
+from models.users import User
+from models.transactions import Transaction
+from connectors.transaction import shipping
+from connectors.transaction.shipping import charged_shipping, shipping_charge_cache, shipping_quote_cache
+
+DELIVERY = {"lat": -7.83, "lng": 110.38}
+
+
+def test_quotes_are_marked_as_estimates(client, market, auth_header):
+    shipping_quote_cache.clear()
+
+    response = client.post("/transaction/shipping_quote", json={"location": DELIVERY, "agent_ids": [market["agent"]]},
+                           headers=auth_header(market["consumer"]))
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["estimated"] is True
+    assert [quote["estimated"] for quote in result["quotes"]] == [True]
+
+
+def test_quote_ids_must_be_integers(client, market, auth_header):
+    response = client.post("/transaction/shipping_quote", json={"location": DELIVERY, "agent_ids": [True]},
+                           headers=auth_header(market["consumer"]))
+
+    assert response.status_code == 400
+
+
+def set_delivery(client, auth_header, market, transaction_id, location=DELIVERY):
+    return client.put("/transaction/delivery_location", json={"transaction_id": transaction_id, "location": location},
+                      headers=auth_header(market["consumer"]))
+
+
+def test_delivery_charges_the_geodesic_cost_of_the_cell(client, market, cart, auth_header):
+    shipping_charge_cache.clear()
+
+    response = set_delivery(client, auth_header, market, cart)
+
+    assert response.status_code == 200
+    _, cost = charged_shipping(shipping_charge_cache.cell((DELIVERY["lat"], DELIVERY["lng"])), (-7.80, 110.37))
+    assert response.get_json()["shipping_cost"] == cost
+    assert db.session.get(Transaction, cart).shipping_cost == cost
+
+
+def test_repeat_deliveries_to_a_cell_skip_the_geometry(client, market, cart, auth_header, monkeypatch):
+    shipping_charge_cache.clear()
+    first = set_delivery(client, auth_header, market, cart).get_json()
+
+    def no_geometry(*args):
+        raise AssertionError("charged_shipping called for a cached cell")
+
+    monkeypatch.setattr(shipping, "charged_shipping", no_geometry)
+    nearby = {"lat": DELIVERY["lat"] + 0.00001, "lng": DELIVERY["lng"]}
+    again = set_delivery(client, auth_header, market, cart, nearby).get_json()
+
+    assert again["shipping_cost"] == first["shipping_cost"]
+
+
+def test_moved_market_is_not_charged_from_the_cache(client, market, cart, auth_header):
+    shipping_charge_cache.clear()
+    before = set_delivery(client, auth_header, market, cart).get_json()
+
+    # Moved by another worker process: this one's cache was not told
+    User.query.filter_by(id=market["agent"]).update({User.location: json.dumps({"lat": -7.70, "lng": 110.37})})
+    db.session.commit()
+    after = set_delivery(client, auth_header, market, cart).get_json()
+
+    assert after["shipping_cost"] > before["shipping_cost"]
@@ -0,0 +1,49 @@
+from models import db
+from models.products import Product
+from connectors.cart.stock import reserve_stock, reserve_stock_many, release_stock
+
+
+def stocks(product_ids):
+    return [db.session.query(Product.stock).filter(Product.id == product_id).scalar() for product_id in product_ids]
+
+
+def test_reserve_stock_takes_units_only_while_there_are_enough(market):
+    product_id = market["products"][0]
+
+    assert reserve_stock(product_id, 7)
+    assert not reserve_stock(product_id, 4)
+    db.session.commit()
+
+    assert stocks([product_id]) == [3]
+
+
+def test_release_stock_adds_to_the_current_value(market):
+    product_id = market["products"][0]
+
+    release_stock(product_id, 5)
+    db.session.commit()
+
+    assert stocks([product_id]) == [15]
+
+
+def test_reserve_stock_many_reserves_every_product(market):
+    first, second = market["products"]
+
+    assert reserve_stock_many({first: 10, second: 3})
+    db.session.commit()
+
+    assert stocks([first, second]) == [0, 7]
+
+
+def test_reserve_stock_many_reports_a_short_product(market):
+    first, second = market["products"]
+
+    assert not reserve_stock_many({first: 2, second: 11})
+    # The caller rolls back, which also returns the units taken from the first product
+    db.session.rollback()
+
+    assert stocks([first, second]) == [10, 10]
+
+
+def test_reserve_stock_many_with_nothing_to_reserve(market):
+    assert reserve_stock_many({})
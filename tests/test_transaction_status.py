@@ -0,0 +1,70 @@
+import pytest
+
+from models import db
+from models.users import User
+from models.products import Product
+from models.transactions import Transaction
+
+
+@pytest.fixture
+def taken(cart, market):
+    """The cart, ordered and taken by a driver."""
+    driver = User(username="driver", fullname="Driver", email="driver@example.com", password_hash="x",
+                  pin_hash="x", phone_number="2", role="driver", agen_id=market["agent"], balance=0)
+    db.session.add(driver)
+    db.session.flush()
+    Transaction.query.filter_by(id=cart).update({Transaction.status: "taken", Transaction.driver_id: driver.id})
+    User.query.filter_by(id=market["agent"]).update({User.balance: 0})
+    db.session.commit()
+    return {"transaction": cart, "driver": driver.id}
+
+
+def balances(*user_ids):
+    db.session.expire_all()
+    return [float(db.session.get(User, user_id).balance) for user_id in user_ids]
+
+
+def complete(client, auth_header, market, transaction_id):
+    return client.put("/transaction/update_status_completed", json={"transaction_id": transaction_id},
+                      headers=auth_header(market["consumer"]))
+
+
+def test_completion_pays_market_and_driver(client, auth_header, market, taken):
+    response = complete(client, auth_header, market, taken["transaction"])
+
+    assert response.status_code == 200
+    assert balances(market["agent"], taken["driver"]) == [4000, 5000]
+    assert db.session.get(Transaction, taken["transaction"]).status == "completed"
+    assert db.session.get(Product, market["products"][0]).ordered_times == 2
+
+
+def test_repeated_completion_pays_once(client, auth_header, market, taken):
+    assert complete(client, auth_header, market, taken["transaction"]).status_code == 200
+
+    assert complete(client, auth_header, market, taken["transaction"]).status_code == 409
+    assert balances(market["agent"], taken["driver"]) == [4000, 5000]
+    assert db.session.get(Product, market["products"][0]).ordered_times == 2
+
+
+@pytest.mark.parametrize("route, body", [
+    ("/transaction/update_status", {"status": "taken"}),
+    ("/transaction/update_balance_and_status", {"status": "ordered", "pin_hash": "1234", "amount": 1,
+                                                "plus_minus": "plus"}),
+])
+def test_completed_transaction_cannot_be_reopened_and_paid_again(client, auth_header, market, taken, route, body):
+    assert complete(client, auth_header, market, taken["transaction"]).status_code == 200
+
+    response = client.put(route, json={"transaction_id": taken["transaction"], **body},
+                          headers=auth_header(market["consumer"]))
+
+    assert response.status_code == 409
+    assert complete(client, auth_header, market, taken["transaction"]).status_code == 409
+    assert balances(market["agent"], taken["driver"]) == [4000, 5000]
+
+
+def test_cart_cannot_be_completed(client, auth_header, market, cart):
+    User.query.filter_by(id=market["agent"]).update({User.balance: 0})
+    db.session.commit()
+
+    assert complete(client, auth_header, market, cart).status_code == 409
+    assert balances(market["agent"]) == [0]